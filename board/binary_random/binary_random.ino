@@ -0,0 +1,42 @@
+/*
+* In this sketch we send binary frames instead of text: the sync bytes 0xA5 0x5A,
+* the serial, the number of channels, one little-endian int16 per channel, and a 
+* checksum, the sum of the bytes after the sync bytes modulo 256. Values are in 
+* thousandths, so the stream should be read with binary_scale=0.001.
+*/
+
+const int NUM_CHANNELS = 8;
+
+void setup() {
+    Serial.begin(115200); 
+}
+
+void loop() {
+    static int seriesStamp = 0;                 // Keeps counting across calls of loop()
+
+    // Generate 8 random signals between -1 and 1 at 125 Hz 
+    for (int i = 0; i < 128; i++) {
+
+        byte frame[5 + 2 * NUM_CHANNELS];
+        frame[0] = 0xA5;
+        frame[1] = 0x5A;
+        frame[2] = seriesStamp;
+        frame[3] = NUM_CHANNELS;
+        for (int j = 0; j < NUM_CHANNELS; j++) {
+            int16_t randomSignal = random(-1000, 1001); 
+            frame[4 + 2 * j] = randomSignal & 0xFF;
+            frame[5 + 2 * j] = (randomSignal >> 8) & 0xFF;
+        }
+
+        byte checksum = 0;
+        for (int k = 2; k < 4 + 2 * NUM_CHANNELS; k++) {
+            checksum += frame[k];
+        }
+        frame[4 + 2 * NUM_CHANNELS] = checksum;
+
+        Serial.write(frame, sizeof(frame)); 
+        delay(8); 
+        seriesStamp++;
+        if (seriesStamp >= 100) seriesStamp = 0;
+    }
+}
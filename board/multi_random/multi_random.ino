@@ -5,7 +5,7 @@ void setup() {
 }
 
 void loop() {
-    int seriesStamp = 0;
+    static int seriesStamp = 0;                 // Keeps counting across calls of loop()
 
     // Generate 8 random signals between -1 and 1 at 125 Hz 
     for (int i = 0; i < 128; i++) {
@@ -9,7 +9,6 @@ if __name__ == '__main__':
     server = Server(
         host="localhost", 
         port=8000,
-        num_files=6,
     )
 
     frame = Frame(
@@ -39,9 +38,10 @@ if __name__ == '__main__':
     stream = Stream(
         serial_port='COM5',
         board_type='Cyton', 
-        read_pause=1, )
+        read_pause=0.02, )
     stream.onload(pipeline=[
-        frame.add_singal,])
+        frame.add_block,], 
+        blocks=True)
     stream.start()
 
     server.run()
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import base64, hashlib, os, threading
+
+
+class Artifact:
+    """
+    The Artifact class holds one file produced by the pipeline for a window, such as
+    a PNG figure, in memory. Its version, a hash of its content that also makes its
+    ETag, is computed once, and its base64 encoding only when it is first asked for.
+    """
+
+    MEDIA_TYPES = {".png": "image/png", ".json": "application/json", ".npz": "application/octet-stream"}
+
+    def __init__(self, name: str, content: bytes) -> None:
+        self.name = name
+        self.content = content
+        self.version = hashlib.blake2b(content, digest_size=16).hexdigest()     # Changes with the content
+        self.etag = f'"{self.version}"'
+        self.media_type = Artifact.MEDIA_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+        self.encoded = None
+
+    def base64(self) -> str:
+        if self.encoded is None:
+            self.encoded = base64.b64encode(self.content).decode("utf-8")
+        return self.encoded
+
+
+class ArtifactCache:
+    """
+    The ArtifactCache class keeps the artifacts of the latest windows in memory,
+    keyed by (session, window, name), and evicts the least recently used ones once
+    their total size exceeds max_bytes. Windows are added whole, once they are
+    complete, so that serving them never touches the disk. It is safe to use from
+    several threads.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple[str, str, str], Artifact] = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def put(self, session: str, window: str, artifact: Artifact) -> None:
+        key = (session, window, artifact.name)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.content)
+            self.entries[key] = artifact
+            self.size += len(artifact.content)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.content)
+
+    def get(self, session: str, window: str, name: str) -> Artifact|None:
+        key = (session, window, name)
+        with self.lock:
+            artifact = self.entries.get(key)
+            if artifact is not None:
+                self.entries.move_to_end(key)
+            return artifact
+
+    def load_window(self, session: str, window: str, folder_path: str, names: list[str],
+                    extensions: tuple[str] = (".png",)) -> list[str]:
+        """
+        Read the given artifacts of a completed window folder once, add those with
+        one of the extensions to the cache, and return their names.
+        """
+        loaded = []
+        for name in names:
+            if not name.lower().endswith(extensions):
+                continue
+            with open(os.path.join(folder_path, name), "rb") as file:
+                self.put(session, window, Artifact(name, file.read()))
+            loaded.append(name)
+        return loaded
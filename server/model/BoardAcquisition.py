@@ -0,0 +1,178 @@
+from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds, BrainFlowError
+import threading, time
+import numpy as np
+
+
+class BoardAcquisition:
+    """
+    The BoardAcquisition class acquires signals from any board supported by
+    BrainFlow, including the synthetic board for offline load tests. The board
+    buffers samples in a ring buffer of buffer_size samples; every poll_interval
+    seconds, on a monotonic schedule, every full chunk of chunk_size samples is
+    taken out of it and returned as a (EEG channels x chunk_size) block. Samples of
+    an incomplete chunk stay on the board until the next poll.
+
+    Two kinds of problems are reported by BoardAcquisition.stats: the jitter of the
+    polls, i.e. how late each poll wakes up after its scheduled time, and overruns,
+    i.e. polls that find the ring buffer full, since the oldest samples may then
+    have been overwritten. Lost samples are also counted from the package number
+    channel of the board, which wraps around at 256.
+
+    BrainFlow refuses a second board with the same type and parameters, so boards
+    without a serial port of their own, such as several synthetic boards, must be
+    given distinct names.
+    """
+
+    PACKAGE_MODULO = 256
+    ALIASES = {"cyton": "CYTON_BOARD", "synthetic": "SYNTHETIC_BOARD"}
+
+    def __init__(
+            self,
+            board_type: str|int,
+            serial_port: str|None = None,
+            poll_interval: float = 0.02,
+            chunk_size: int|None = None,
+            buffer_size: int = 45000,
+            name: str|None = None,
+            ) -> None:
+
+        self.board_id = BoardAcquisition.get_board_id(board_type)
+        self.sample_rate = BoardShim.get_sampling_rate(self.board_id)
+        self.eeg_channels = BoardShim.get_eeg_channels(self.board_id)       # Looked up once, not on every poll
+        self.package_channel = BoardShim.get_package_num_channel(self.board_id)
+        try:
+            self.channel_labels = BoardShim.get_eeg_names(self.board_id)
+        except BrainFlowError:
+            self.channel_labels = None
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size or max(1, int(round(self.sample_rate * poll_interval)))
+        self.buffer_size = buffer_size
+        if self.chunk_size > buffer_size:
+            raise ValueError("The chunk size must not exceed the buffer size of the board.")
+
+        self.board_params = BrainFlowInputParams()
+        if serial_port is not None:
+            self.board_params.serial_port = serial_port
+        if name is not None:                            # BrainFlow allows one board per type and parameters
+            self.board_params.other_info = name
+        self.board = BoardShim(self.board_id, self.board_params)
+        self.last_package = None
+        self.running = False
+        self.idle = threading.Event()                   # Set while run is not polling the board
+        self.idle.set()
+        self.reset_stats()
+
+    @staticmethod
+    def get_board_id(board_type: str|int) -> int:
+        """
+        Get the BrainFlow board id of a board given by id, by name such as
+        "SYNTHETIC_BOARD" or "CYTON_DAISY_BOARD", or by the aliases "Cyton" and
+        "Synthetic".
+        """
+        if isinstance(board_type, int):
+            return BoardIds(board_type).value
+        name = BoardAcquisition.ALIASES.get(board_type.lower(), board_type.upper())
+        try:
+            return BoardIds[name].value
+        except KeyError:
+            raise ValueError(f"Unknown BrainFlow board {board_type}.")
+
+    def reset_stats(self) -> None:
+        self.stats = {
+            "polls": 0,
+            "chunks": 0,
+            "samples": 0,
+            "jitter_mean": 0.0,                 # Seconds a poll wakes up after its scheduled time
+            "jitter_max": 0.0,
+            "overruns": 0,                      # Polls that found the ring buffer full
+            "lost_samples": 0,                  # Samples missing from the package numbers
+            "max_buffered": 0,                  # Most samples waiting on the board at a poll
+        }
+
+    def prepare(self) -> None:
+        if not self.board.is_prepared():
+            self.board.prepare_session()
+
+    def start(self) -> None:
+        self.prepare()
+        self.board.start_stream(self.buffer_size)
+        self.running = True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.running = False
+        self.idle.wait(timeout)                         # Let the last poll finish before releasing the board
+        try:
+            self.board.stop_stream()
+        finally:
+            self.board.release_session()
+
+    def poll(self) -> list[tuple[np.ndarray, float]]:
+        """
+        Take every full chunk out of the ring buffer of the board, and return their
+        (EEG channels x chunk_size) blocks, each with the time.monotonic() at which
+        it was taken off the board.
+        """
+        self.stats["polls"] += 1
+        try:
+            count = self.board.get_board_data_count()
+        except BrainFlowError:
+            print("Failed to retrieve data for this iteration. Continuing onto the next iteration.")
+            return []
+        self.stats["max_buffered"] = max(self.stats["max_buffered"], int(count))
+        if count >= self.buffer_size:
+            self.stats["overruns"] += 1
+
+        blocks = []
+        for _ in range(count // self.chunk_size):
+            try:
+                data = self.board.get_board_data(self.chunk_size)
+            except BrainFlowError:
+                print("Failed to retrieve data for this iteration. Continuing onto the next iteration.")
+                break
+            acquired = time.monotonic()
+            self._track_packages(data[self.package_channel])
+            blocks.append((np.ascontiguousarray(data[self.eeg_channels]), acquired))
+        self.stats["chunks"] += len(blocks)
+        self.stats["samples"] += len(blocks) * self.chunk_size
+        return blocks
+
+    def _track_packages(self, packages: np.ndarray) -> None:
+        packages = packages.astype(np.int64)
+        if self.last_package is not None:
+            packages = np.concatenate([[self.last_package], packages])
+        steps = np.diff(packages) % BoardAcquisition.PACKAGE_MODULO
+        self.stats["lost_samples"] += int(np.sum(steps[steps > 1] - 1))
+        self.last_package = int(packages[-1])
+
+    def run(self, emit_block: callable) -> None:
+        """
+        Poll the board every poll_interval seconds until BoardAcquisition.stop, and
+        pass every chunk to emit_block, with the time it was acquired. Polls are
+        scheduled against a monotonic clock, so that a slow pipeline delays the next
+        poll instead of shifting every later one; a poll that is more than one
+        interval late is not made up for.
+        """
+        if not self.running:
+            self.start()
+        self.idle.clear()
+        try:
+            self._run(emit_block)
+        finally:
+            self.idle.set()
+
+    def _run(self, emit_block: callable) -> None:
+        next_poll = time.monotonic()
+        while self.running:
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not self.running:
+                break
+            jitter = max(0.0, time.monotonic() - next_poll)
+            polls = self.stats["polls"]
+            self.stats["jitter_mean"] = (self.stats["jitter_mean"] * polls + jitter) / (polls + 1)
+            self.stats["jitter_max"] = max(self.stats["jitter_max"], jitter)
+
+            for block, acquired in self.poll():
+                emit_block(block, acquired=acquired)
+            next_poll = max(next_poll + self.poll_interval, time.monotonic() - self.poll_interval)
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class Decimation:
+    """
+    The Decimation class reduces (channels x samples) signals to about as many
+    points as can be drawn, such as the width of a screen in pixels, so that they
+    can be sent to and drawn by a client cheaply.
+    """
+
+    def __init__(self) -> None:
+        raise TypeError("The Decimation class is a static class, and cannot be initialized.")
+
+    @staticmethod
+    def bucket_edges(num_samples: int, num_buckets: int) -> np.ndarray:
+        return np.linspace(0, num_samples, num_buckets + 1).astype(np.int64)
+
+    @staticmethod
+    def min_max(data: np.ndarray, num_buckets: int) -> np.ndarray:
+        """
+        Split the samples into num_buckets buckets of about the same size, and keep
+        the minimum and the maximum of each, so that every peak stays visible. Returns
+        a (channels x 2 * num_buckets) array alternating the minimum and the maximum
+        of each bucket, or the data itself if it is not larger than that.
+        """
+        num_samples = data.shape[-1]
+        if num_buckets < 1:
+            raise ValueError("The number of buckets must be positive.")
+        if num_samples <= 2 * num_buckets:
+            return data
+        starts = Decimation.bucket_edges(num_samples, num_buckets)[:-1]
+        decimated = np.empty(data.shape[:-1] + (num_buckets, 2), dtype=data.dtype)
+        decimated[..., 0] = np.minimum.reduceat(data, starts, axis=-1)
+        decimated[..., 1] = np.maximum.reduceat(data, starts, axis=-1)
+        return decimated.reshape(data.shape[:-1] + (2 * num_buckets,))
+
+    @staticmethod
+    def lttb(data: np.ndarray, num_points: int) -> np.ndarray:
+        """
+        Pick num_points samples of each channel with the Largest-Triangle-Three-Buckets
+        algorithm, which keeps the visual shape of a signal better than taking every
+        n-th sample. The first and last samples are always kept. Returns the
+        (channels x num_points) indices of the samples picked, or every index if the
+        data is not larger than that; the values are then data.take_along_axis.
+        """
+        num_channels, num_samples = data.shape
+        if num_points < 3:
+            raise ValueError("LTTB needs at least 3 points.")
+        if num_points >= num_samples:
+            return np.tile(np.arange(num_samples), (num_channels, 1))
+
+        # The samples between the first and the last are split into num_points - 2 buckets
+        edges = 1 + Decimation.bucket_edges(num_samples - 2, num_points - 2)
+        indices = np.empty((num_channels, num_points), dtype=np.int64)
+        indices[:, 0] = 0
+        indices[:, -1] = num_samples - 1
+        rows = np.arange(num_channels)
+        previous = np.zeros(num_channels, dtype=np.int64)
+        for bucket in range(num_points - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            if bucket + 2 < len(edges):
+                next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+                next_x = (next_start + next_end - 1) / 2
+                next_y = data[:, next_start:next_end].mean(axis=1)
+            else:
+                next_x = num_samples - 1
+                next_y = data[:, -1]
+
+            # Pick the sample making the largest triangle with the previous pick and
+            # the average of the next bucket, for all channels at once
+            previous_x = previous.astype(float)
+            previous_y = data[rows, previous]
+            xs = np.arange(start, end)
+            areas = np.abs(
+                (previous_x[:, None] - next_x) * (data[:, start:end] - previous_y[:, None])
+                - (previous_x[:, None] - xs[None, :]) * (next_y - previous_y)[:, None])
+            previous = start + np.argmax(areas, axis=1)
+            indices[:, bucket + 1] = previous
+        return indices
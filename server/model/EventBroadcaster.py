@@ -0,0 +1,71 @@
+from collections import deque
+import asyncio, threading
+
+
+class EventBroadcaster:
+    """
+    The EventBroadcaster class broadcasts events, such as completed windows, from
+    any thread to every subscriber on the event loop of the server. Every event gets
+    an increasing id, and the latest ones are kept in a bounded history, so that
+    each subscriber only keeps its own cursor, the id of the last event it received,
+    and a subscriber that reconnects with its cursor misses nothing still retained.
+    Subscribers wait without polling until an event is published.
+    """
+
+    def __init__(self, history: int = 256) -> None:
+        self.events = deque(maxlen=history)             # (id, event) pairs, oldest first
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.loop = None                                # Event loop of the subscribers
+        self.changed = None                             # asyncio.Event set on the next publish
+
+    def publish(self, event: dict) -> int:
+        """
+        Add an event to the history and wake every subscriber. Safe to call from any
+        thread. Returns the id of the event.
+        """
+        with self.lock:
+            event_id = self.next_id
+            self.next_id += 1
+            self.events.append((event_id, event))
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._notify)
+        return event_id
+
+    def _notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def since(self, cursor: int|None) -> list[tuple[int, dict]]:
+        """
+        Get the retained events after the given cursor. Without a cursor, only the
+        latest event is returned, so that a new subscriber starts from the present.
+        """
+        with self.lock:
+            if cursor is None:
+                return list(self.events)[-1:]
+            return [(event_id, event) for event_id, event in self.events if event_id > cursor]
+
+    async def subscribe(self, cursor: int|None = None, keepalive: float = 15.0):
+        """
+        Yield the (id, event) pairs after the cursor as they are published, forever.
+        None is yielded after keepalive seconds without an event, so that the caller
+        can check that its client is still connected.
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.changed = asyncio.Event()
+        while True:
+            changed = self.changed                      # Taken before reading, so no publish is missed
+            events = self.since(cursor)
+            for event_id, event in events:
+                cursor = event_id
+                yield event_id, event
+            if cursor is None:
+                cursor = 0
+            if events:
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
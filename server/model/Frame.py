@@ -1,17 +1,21 @@
-from collections import deque
 from datetime import datetime
-import multiprocessing, os, json
-from model.MNEDriver import MNEDriver
+import os, time
+import numpy as np
+from model.LatencyTracker import LatencyTracker
+from model.PipelinePlan import PipelinePlan
+from model.RingBuffer import RingBuffer
 from model.Server import Server
-from datetime import datetime
+from model.SharedWindowBuffer import SharedWindowBuffer
+from model.WindowProcessor import WindowProcessor
+from model.WorkerPool import WorkerPool
 
 class Frame:
     """
     The Frame class is the top-level data structure that holds all incoming EEG data. 
-    At its core, it uses a deque to store incoming signal values, hold the values for
-    a fixed period of time, and then delete the oldest values. For every specified 
-    period, the Frame processes the stored signal values and makes the statistics 
-    available to an external observer (usually an API).
+    At its core, it uses a preallocated ring buffer to store incoming signal values, 
+    hold the values for a fixed period of time, and then overwrite the oldest values.
+    For every specified period, the Frame processes the stored signal values and 
+    makes the statistics available to an external observer (usually an API).
     """
 
     def __init__(
@@ -23,16 +27,28 @@ class Frame:
             output_directory: str,
             montage: str = "standard_1020",
             channel_types: list[str]|None = None,
-            server: Server|None = None
+            server: Server|None = None,
+            dtype: str = "float64",
+            num_workers: int = 2,
+            max_queued_windows: int = 4,
+            overflow_policy: str = "drop_oldest",
+            name: str = "default",
+            pool: WorkerPool|None = None,
+            latency_history: int = 256,
             ) -> None:
         
+        if window_size_samples > max_cache_samples:
+            raise ValueError("The window size must not exceed the number of cached samples.")
+
         self.sample_rate = sample_rate                      # Number of samples per second
         self.channels = channels                            # List of channel names
-        self.channel_data = {                               # Dictionary of channels and their data
-                channel: deque(maxlen=max_cache_samples) 
-            for channel in channels}
+        self.channel_data = RingBuffer(                     # Ring buffer of (channels x max_cache_samples)
+            num_channels=len(channels), 
+            capacity=max_cache_samples, 
+            dtype=dtype)
         self.clock = 0                                      # Incremented for every new signal
         self.pipeline = []                                  # List of functions to process signals
+        self.plan = None                                    # The pipeline compiled by Frame.wrap
         self.window_size_samples = window_size_samples      # Number of samples per window
         self.timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
         self.output_directory = output_directory            # Directory to store results
@@ -40,10 +56,27 @@ class Frame:
         self.montage = montage
         self.channel_types = channel_types
         self.last_window_begin_time = None
+        self.last_window_begin_timestamp = None
+        self.name = name                                    # Name of the session, for the pool and the server
+        self.server = server
+        self.owns_pool = pool is None                       # A shared pool is started and stopped by its owner
+        if pool is None:
+            pool = WorkerPool(                              # Long-lived processes running the pipeline
+                num_workers=num_workers,
+                max_queued=max_queued_windows,
+                overflow_policy=overflow_policy)
+        self.pool = pool
+        self.latency = LatencyTracker(history=latency_history)  # Traces of the latest windows
+        self.windows = SharedWindowBuffer(                  # Shared memory slots handing windows to the workers
+            num_slots=self.pool.max_queued + self.pool.num_workers + 3, 
+            num_channels=len(channels), 
+            num_samples=window_size_samples, 
+            dtype=dtype)
 
         os.makedirs(self.output_destination, exist_ok=True)
         if server is not None:
-            server.inject_output_destination_name(self.output_destination)
+            server.inject_output_destination_name(self.output_destination, name=self.name, latency=self.latency)
+            server.telemetry.add_collector(self.collect_metrics, labels={"session": self.name})
 
     def add_singal(self, signals: str) -> None:
         """
@@ -54,60 +87,193 @@ class Frame:
         signals_list = signals.split(",")
         if len(signals_list) < len(self.channels):
             raise ValueError("The number of signals must >= the number of channels.")
-        for i, _ in enumerate(self.channels):
-            self.channel_data[self.channels[i]].append(signals_list[i])
+        values = np.array(signals_list[:len(self.channels)], dtype=self.channel_data.dtype)
+        self.add_block(values.reshape(-1, 1))
 
-        if self.clock % self.window_size_samples == 0:
-            current_time = str(datetime.now().time())
-            self.last_window_begin_time = current_time
+    def add_block(self, block: np.ndarray, acquired: float|None = None) -> None:
+        """
+        Add a (channels x n) block of signals to the frame at once. Rows beyond the 
+        number of channels are ignored. The block is split at window boundaries, so 
+        that every window is wrapped on exactly the same sample as with add_singal,
+        even when a block spans several windows. acquired is the time.monotonic() at
+        which the block was acquired, as passed by a Stream when it reads the block
+        from a board, a serial port or a file, and defaults to now.
+        """
+        if acquired is None:
+            acquired = time.monotonic()
+        block = np.asarray(block)
+        if block.ndim != 2 or block.shape[0] < len(self.channels):
+            raise ValueError("The block must be 2D with rows >= the number of channels.")
+        block = block[:len(self.channels)]
 
-        if (self.clock + 1) % self.window_size_samples == 0:
-            self.do_wrap(window_begin_time=str(self.last_window_begin_time))        # Force string copying
-        self.clock += 1
+        start = 0
+        num_samples = block.shape[1]
+        while start < num_samples:
+            if self.clock % self.window_size_samples == 0:
+                current_time = datetime.now()
+                self.last_window_begin_time = str(current_time.time())
+                self.last_window_begin_timestamp = current_time.timestamp()
+
+            remaining_in_window = self.window_size_samples - self.clock % self.window_size_samples
+            end = min(num_samples, start + remaining_in_window)
+            self.channel_data.extend(block[:, start:end])
+            self.clock += end - start
+            start = end
+
+            if self.clock % self.window_size_samples == 0:
+                self.latency.open(str(self.clock - 1), acquired=acquired, closed=time.monotonic())
+                self.publish_window(
+                    signal_serial=self.clock - 1, 
+                    window_begin_timestamp=self.last_window_begin_timestamp)
+                self.do_wrap(
+                    window_begin_time=str(self.last_window_begin_time),     # Force string copying
+                    signal_serial=self.clock - 1,                           # Serial of the last sample
+                    window_begin_timestamp=self.last_window_begin_timestamp)
 
     def wrap(self, pipeline: list[callable]) -> None:
         """
         For every window_size_samples, the Frame processes the latest signal values, 
         performs analyses, and makes the results available to an external observer.
+        The worker processes are started here, so the pipeline must be final. If the
+        pool is shared, it is started by its owner, such as the SessionManager. The
+        pipeline is compiled into a PipelinePlan first, and a ValueError is raised
+        if any of its stages is not valid. A pipeline with stages that carry state
+        across windows, such as stream_filter or record_psd, runs all of its windows
+        on a single worker, so that they continue each other.
         """
+        self.plan = PipelinePlan.compile(                   # Raises before any window is processed
+            pipeline=pipeline,
+            sample_rate=self.sample_rate,
+            output_destination=self.output_destination)
         self.pipeline = pipeline
-
-    def _process_wrap_pipeline(self, channel_lists, window_begin_time:str|None = None) -> None:
-        mne_driver = MNEDriver(
+        self.pool.register(self.name, WindowProcessor(
             sample_rate=self.sample_rate,
             channels=self.channels,
-            channel_types=self.channel_types,
-            channel_data_lists=channel_lists,
             output_destination=self.output_destination,
-            signal_serial=self.clock,
+            plan=self.plan,
+            windows=self.windows,
             montage=self.montage,
-            window_begin_time=window_begin_time
-        )
-
-        for processor in self.pipeline:
-            # print(window_begin_time)
-            if type(processor) is tuple:
-                if processor[1].get("cascade_output", False):
-                    processor[1]["output_destination"] = self.output_destination
-                    processor[1]["signal_serial"] = self.clock
-                processor[0](mne_driver, **processor[1])
-            else:
-                processor(mne_driver)
+            channel_types=self.channel_types), 
+            on_drop=self._release_window,
+            on_complete=self._window_complete,
+            affinity=self.plan.stateful)                    # Filter and Welch state must carry over between windows
+        if self.owns_pool:
+            self.pool.start()
         
-    def do_wrap(self, window_begin_time:str|None = None) -> None:
+    def publish_window(self, signal_serial: int, window_begin_timestamp: float|None = None) -> None:
+        """
+        Hand the raw signals of the window that just completed to the server, so that
+        clients can draw the waveforms without any pipeline stage rendering them.
+        """
+        if self.server is None:
+            return
+        self.server.publish_signal(
+            session_name=self.name,
+            window=str(signal_serial),
+            data=self.channel_data.latest(self.window_size_samples),
+            sample_rate=self.sample_rate,
+            channels=self.channels,
+            begin_timestamp=window_begin_timestamp)
+
+    def do_wrap(
+            self, 
+            window_begin_time:str|None = None, 
+            signal_serial:int|None = None, 
+            window_begin_timestamp:float|None = None,
+            ) -> None:
         """
         Perform the processing of the signal values, as defined by Frame.wrap(pipeline).
-        This function will now spawn a new process and run the pipeline in that process,
-        allowing parallel computation.
+        The window is queued for the worker processes, allowing parallel computation.
+        If the workers fall behind, the overflow policy of the Frame decides which
+        windows are dropped.
+        """
+        if signal_serial is None:
+            signal_serial = self.clock
+        if not self.pool.started:
+            self.latency.discard(str(signal_serial))
+            return
+
+        # Publish the window into shared memory, so that only the slot index is sent
+        slot = self.windows.acquire()
+        if slot is None:
+            raise RuntimeError("No shared memory slot is free for the new window.")
+        self.windows.write(slot, self.channel_data.latest(self.window_size_samples))
+        self.latency.mark(str(signal_serial), "submitted", time.monotonic())
+        self.pool.submit(self.name, slot, window_begin_time, signal_serial, window_begin_timestamp)
+
+    def _release_window(self, slot: int, window_begin_time=None, signal_serial=None, *args) -> None:
+        self.windows.release(slot)
+        self.latency.discard(str(signal_serial))
+
+    def _window_complete(self, result: dict) -> None:
+        # Called by the pool as soon as a worker is done with a window
+        collected = time.monotonic()
+        published = None
+        if self.server is not None:
+            self.server.notify_window_complete(self.name, result["window"], result["artifacts"])
+            published = time.monotonic()                    # Queued for the clients, which read it at their pace
+        trace = self.latency.complete(
+            result["window"],
+            started=result["started"],
+            stages=result["stages"],
+            written=result["written"],
+            collected=collected,
+            published=published)
+        if self.server is None:
+            return
+
+        telemetry = self.server.telemetry
+        for stage, start, end, cpu in result["stages"]:
+            labels = {"session": self.name, "stage": stage}
+            telemetry.observe("stage_wall_seconds", end - start, labels, "Wall time of each pipeline stage.")
+            telemetry.observe("stage_cpu_seconds", cpu, labels, "CPU time of each pipeline stage, in its worker.")
+        telemetry.observe("window_wall_seconds", result["written"] - result["started"], {"session": self.name},
+                          "Wall time of the whole pipeline on a window.")
+        if trace is not None:
+            for segment, seconds in LatencyTracker.breakdown(trace).items():
+                telemetry.observe("latency_seconds", seconds, {"session": self.name, "segment": segment},
+                                  "Latency of each segment of the path of a window, from acquisition to delivery.")
+
+    def get_stats(self) -> dict[str, int]:
         """
-        channel_lists = [list(self.channel_data[channel])[-self.window_size_samples:] 
-                         for channel in self.channels]
+        Get the number of windows submitted, queued, in flight, completed and dropped.
+        """
+        return self.pool.stats(self.name)
 
-        # Create a new process targeting the process_pipeline method
-        process = multiprocessing.Process(
-            target=self._process_wrap_pipeline,
-            args=(channel_lists, window_begin_time))
-        process.start()     # Start the process
-        # process.join()    # Shouldn't need this for now
+    def get_latency(self) -> dict[str, dict[str, float]]:
+        """
+        Get the latency breakdown of the latest windows: for every segment of their
+        path, from the acquisition of their last sample to their delivery to a
+        client by the server, the number of windows, and the mean, median, 90th and
+        99th percentiles and maximum in seconds. See LatencyTracker.breakdown for
+        the segments.
+        """
+        return self.latency.summary()
 
+    def collect_metrics(self) -> list[tuple]:
+        """
+        Get the window counters and the backlog of the Frame as telemetry metrics.
+        """
+        stats = self.get_stats()
+        used_slots = self.windows.num_used()
+        return [
+            ("samples_framed_total", "counter", "Samples added to the frame.", None, self.clock),
+            ("windows_submitted_total", "counter", "Windows handed to the worker pool.", None, stats["submitted"]),
+            ("windows_completed_total", "counter", "Windows the pipeline completed.", None, stats["completed"]),
+            ("windows_dropped_total", "counter", "Windows dropped by the overflow policy.", None, stats["dropped"]),
+            ("windows_queued", "gauge", "Windows waiting for a worker.", None, stats["queued"]),
+            ("windows_in_flight", "gauge", "Windows being processed by a worker.", None, stats["in_flight"]),
+            ("window_slots_used", "gauge", "Shared memory slots holding a pending window.", None, used_slots),
+            ("window_slots_free", "gauge", "Shared memory slots free for new windows.", None,
+             self.windows.num_slots - used_slots),
+        ]
 
+    def close(self) -> None:
+        """
+        Stop the worker processes once the windows they are running are done, and
+        free the shared memory holding the windows. A shared pool must be stopped
+        by its owner before the Frame is closed.
+        """
+        if self.owns_pool:
+            self.pool.stop()
+        self.windows.close()
@@ -0,0 +1,146 @@
+from collections import deque, OrderedDict
+import threading
+import numpy as np
+
+
+class LatencyTracker:
+    """
+    The LatencyTracker class follows every window from the moment its last sample
+    is acquired until the server delivers its artifacts to a client. Each window
+    has a trace, a dict of time.monotonic() timestamps, which is comparable across
+    the worker processes of the same machine:
+
+        acquired    the block holding the last sample of the window reached the Frame
+        closed      the window is complete in the ring buffer
+        submitted   the window is handed to the worker pool
+        started     a worker begins the pipeline
+        stages      (name, start, end, cpu) for every stage of the pipeline
+        written     every artifact of the window is written
+        collected   the result is back in the process of the Frame
+        published   the server has queued the window for its subscribed clients
+        delivered   the server first sent the window to a client, as an event or
+                    one of its artifacts
+
+    Traces are opened when a window closes, completed once it is published, and
+    the latest ones are kept to be summarized as latency breakdowns; a window
+    delivered later is added to its completed trace. It is safe to use from several
+    threads.
+    """
+
+    def __init__(self, history: int = 256) -> None:
+        self.pending: OrderedDict[str, dict] = OrderedDict()  # Window -> trace of windows not published yet
+        self.traces = deque(maxlen=history)                 # Completed traces, oldest first
+        self.completed: OrderedDict[str, dict] = OrderedDict()  # Window -> the same traces, to mark their delivery
+        self.history = history
+        self.lock = threading.Lock()
+
+    def open(self, window: str, **timestamps) -> None:
+        with self.lock:
+            self.pending[window] = dict(timestamps, window=window)
+            while len(self.pending) > self.history:        # Windows lost by a failing pipeline
+                self.pending.popitem(last=False)
+
+    def mark(self, window: str, point: str, timestamp: float) -> None:
+        with self.lock:
+            trace = self.pending.get(window)
+            if trace is not None:
+                trace[point] = timestamp
+
+    def discard(self, window: str) -> None:
+        """
+        Forget the trace of a window dropped before it was processed.
+        """
+        with self.lock:
+            self.pending.pop(window, None)
+
+    def complete(self, window: str, **timestamps) -> dict|None:
+        """
+        Add the last timestamps to the trace of a window, and keep it among the
+        completed traces. Returns the trace, or None if the window was not traced.
+        """
+        with self.lock:
+            trace = self.pending.pop(window, None)
+            if trace is None:
+                return None
+            trace.update(timestamps)
+            if trace.get("delivered") is not None and trace.get("published") is not None:
+                # A client may receive the event before the publication is stamped
+                trace["delivered"] = max(trace["delivered"], trace["published"])
+            self.traces.append(trace)
+            self.completed[window] = trace
+            while len(self.completed) > self.history:
+                self.completed.popitem(last=False)
+            return trace
+
+    def deliver(self, window: str, timestamp: float) -> dict|None:
+        """
+        Mark a window as delivered, unless it already was. Returns the trace if this
+        is its first delivery, or None.
+        """
+        with self.lock:
+            trace = self.completed.get(window) or self.pending.get(window)
+            if trace is None or trace.get("delivered") is not None:
+                return None
+            trace["delivered"] = timestamp
+            return trace
+
+    @staticmethod
+    def breakdown(trace: dict) -> dict[str, float]:
+        """
+        Split the latency of a window into consecutive segments, in seconds: the time
+        to close the window, to hand it to the pool, waiting for a worker, each stage
+        of the pipeline (the first, "setup", copies the window out of shared memory),
+        returning the result, publishing it, and delivering it to a client; and the
+        total, from the acquisition of the last sample to the delivery, or else to
+        the publication, or to the collection without a server.
+        Segments whose timestamps are missing are left out.
+        """
+        segments = dict()
+
+        def add(segment, begin, end):
+            if trace.get(begin) is not None and trace.get(end) is not None:
+                segments[segment] = trace[end] - trace[begin]
+
+        add("closing", "acquired", "closed")
+        add("submitting", "closed", "submitted")
+        add("queued", "submitted", "started")
+        for name, start, end, _ in trace.get("stages", []):
+            segments[name] = segments.get(name, 0.0) + end - start
+        add("returning", "written", "collected")
+        add("publishing", "collected", "published")
+        add("delivering", "published", "delivered")
+        for last in ("delivered", "published", "collected"):
+            if trace.get(last) is not None:
+                break
+        add("total", "acquired", last)
+        return segments
+
+    def recent(self, count: int|None = None) -> list[dict]:
+        with self.lock:
+            traces = list(self.traces)
+        return traces if count is None else traces[-count:]
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        Summarize the breakdowns of the completed traces kept: the number of windows,
+        the mean, median, 90th and 99th percentiles, and maximum of every segment, in
+        seconds, in the order of the path of a window.
+        """
+        values: dict[str, list[float]] = dict()
+        for trace in self.recent():
+            for segment, seconds in LatencyTracker.breakdown(trace).items():
+                values.setdefault(segment, []).append(seconds)
+        if "total" in values:
+            values["total"] = values.pop("total")           # Keep the total last
+        summary = dict()
+        for segment, seconds in values.items():
+            seconds = np.array(seconds)
+            summary[segment] = {
+                "count": len(seconds),
+                "mean": float(seconds.mean()),
+                "p50": float(np.percentile(seconds, 50)),
+                "p90": float(np.percentile(seconds, 90)),
+                "p99": float(np.percentile(seconds, 99)),
+                "max": float(seconds.max()),
+            }
+        return summary
@@ -1,24 +1,41 @@
 import numpy as np
 import mne, os, json
 from scipy.signal import savgol_filter as scipy_savgol
+from scipy.ndimage import uniform_filter1d
+import matplotlib
+matplotlib.use("Agg")                               # Figures are only ever written to files
 import matplotlib.pyplot as plt
+from model.PSDEngine import PSDEngine
+from model.Renderer import Renderer
+from model.SessionStore import SessionStore
+from model.StreamingFilter import StreamingFilter
 # from mne.preprocessing import ICA
 
 class MNEDriver:
 
+    info_cache: dict[tuple, mne.Info] = dict()      # (channels, types, sfreq, montage) -> Info, per process
+    BANDS = {                                       # Frequency bands of the PSD topomaps, as in MNE
+        "Delta (0-4 Hz)": (0, 4), 
+        "Theta (4-8 Hz)": (4, 8), 
+        "Alpha (8-12 Hz)": (8, 12),
+        "Beta (12-30 Hz)": (12, 30), 
+        "Gamma (30-45 Hz)": (30, 45),
+    }
+
     def __init__(
             self, 
             sample_rate: int,
             channels: list[str],
-            channel_data_lists: list[list[float]],
+            channel_data_lists: np.ndarray|list[list[float]],
             output_destination: str,
             signal_serial: int,
             montage: str = "standard_1020",
             channel_types: list[str]|None = None,
             window_begin_time:str|None = None,
+            window_begin_timestamp:float|None = None,
             ) -> None:
         
-        self.channel_data_lists = np.array(channel_data_lists).astype(float)
+        self.channel_data_lists = np.array(channel_data_lists, dtype=np.float64)
         self.sample_rate = sample_rate
         self.channels = channels
         self.output_destination = output_destination
@@ -29,35 +46,95 @@ class MNEDriver:
         self.num_channels = len(self.channels)
         self.num_samples = len(self.channel_data_lists[0])
         
-        self.mne_info = mne.create_info(
-            ch_names=self.channels,
-            sfreq=self.sample_rate,
-            ch_types=channel_types if channel_types is not None else ["eeg"]*len(self.channels),
-        )
-        self.mne_raw = mne.io.RawArray(self.channel_data_lists, self.mne_info)
+        self.montage = montage
+        self.mne_info = MNEDriver.get_info(
+            channels=self.channels, 
+            channel_types=channel_types, 
+            sample_rate=self.sample_rate, 
+            montage=self.montage)
+        self.mne_raw = mne.io.RawArray(self.channel_data_lists, self.mne_info, verbose=False)
+        self.channel_data_lists = self.mne_raw._data
         self.signal_serial = signal_serial
 
-        self.montage = montage
-        self.mne_raw.set_montage(mne.channels.make_standard_montage(self.montage))
         self.sequence = 0
         self.window_begin_time = window_begin_time
+        self.window_begin_timestamp = window_begin_timestamp       # Seconds since the epoch
+        self.evoked = None
+        self.data_version = 0                       # Incremented whenever a stage modifies the data
+        self.psd = None                             # (data_version, Spectrum) of the latest computed PSD
+        self.artifacts = []                         # Names of the files written for this window
+
+    @staticmethod
+    def get_info(
+            channels: list[str], 
+            channel_types: list[str]|None, 
+            sample_rate: int, 
+            montage: str) -> mne.Info:
+        """
+        Get the measurement info of a channel set, with its montage already applied.
+        The info never changes for a fixed channel set, so it is built once per process
+        and cached; RawArray copies it, so the cached info is never modified.
+        """
+        if channel_types is None:
+            channel_types = ["eeg"]*len(channels)
+        key = (tuple(channels), tuple(channel_types), sample_rate, montage)
+        if key not in MNEDriver.info_cache:
+            info = mne.create_info(ch_names=list(channels), sfreq=sample_rate, ch_types=list(channel_types))
+            info.set_montage(mne.channels.make_standard_montage(montage))
+            MNEDriver.info_cache[key] = info
+        return MNEDriver.info_cache[key]
+
+    def load_data(self, channel_data_lists: np.ndarray|list[list[float]]) -> None:
+        """
+        Load new data of the same shape into the prepared RawArray, in place, so that
+        neither the info nor the montage has to be set up again.
+        """
+        data = np.asarray(channel_data_lists, dtype=np.float64)
+        if data.shape != self.mne_raw._data.shape:
+            raise ValueError("The new data must have the same shape as the current data.")
+        if data is not self.mne_raw._data:
+            self.mne_raw._data[:] = data
+        self.channel_data_lists = self.mne_raw._data
         self.evoked = None
+        self.data_version += 1
 
+    def load_window(
+            self, 
+            channel_data_lists: np.ndarray|list[list[float]], 
+            signal_serial: int,
+            window_begin_time:str|None = None,
+            window_begin_timestamp:float|None = None,
+            ) -> None:
+        """
+        Prepare the driver for the next window of the same channels, as if it were
+        new: the data is loaded in place, the filter settings that MNE filters write
+        into the info are restored, and the artifacts and sequence start again.
+        """
+        self.load_data(channel_data_lists)
+        with self.mne_raw.info._unlock():
+            self.mne_raw.info["highpass"] = self.mne_info["highpass"]
+            self.mne_raw.info["lowpass"] = self.mne_info["lowpass"]
+        self.signal_serial = signal_serial
+        self.window_begin_time = window_begin_time
+        self.window_begin_timestamp = window_begin_timestamp
+        self.sequence = 0
+        self.psd = None
+        self.artifacts = []
 
     def re_init(self, channel_data_lists: list[list[float]]):
         """
         Reinitialize the MNEDriver with new channel data lists. The is useful for 
         scenarios such as adding noise to the EEG data. 
         """
-        self.channel_data_lists = np.array(channel_data_lists)
-        self.mne_raw = mne.io.RawArray(self.channel_data_lists, self.mne_info)
-        self.mne_raw.set_montage(mne.channels.make_standard_montage(self.montage))
+        self.load_data(channel_data_lists)
 
     def get_path_name(self, file_name: str) -> str:
         dir_path = os.path.join(self.output_destination, f"{self.signal_serial}")
         if not os.path.exists(dir_path):
             os.makedirs(dir_path)
         file_name = self.get_file_name(file_name)
+        if file_name not in self.artifacts:
+            self.artifacts.append(file_name)
         return os.path.join(dir_path, file_name)
     
     def get_file_name(self, file_name: str):
@@ -68,6 +145,15 @@ class MNEDriver:
         with open(self.get_path_name(file_name), "w") as file:
             json.dump(data, file)
 
+    def get_psd(self) -> mne.time_frequency.Spectrum:
+        """
+        Get the power spectral density of the current data. It is computed at most
+        once for every version of the data, and shared by all the stages that plot it.
+        """
+        if self.psd is None or self.psd[0] != self.data_version:
+            self.psd = (self.data_version, self.mne_raw.compute_psd(verbose=False))
+        return self.psd[1]
+
     def get_average_signal(self) -> float:
         """
         Get the average value of each individual signal. Specifically, 
@@ -83,54 +169,189 @@ class MNEDriver:
         mne_driver.write_json("data.json", raw_dict)
         mne_driver.sequence += 1
     
+    @staticmethod
+    def record_session(mne_driver, name="session", **kwargs):
+        """
+        Record the current data into the append-only binary store of the session, 
+        instead of one JSON file per window. Several record_session stages in the 
+        same pipeline must be given different names.
+        """
+        store = SessionStore.open(
+            directory=os.path.join(mne_driver.output_destination, name),
+            channels=mne_driver.channels,
+            sample_rate=mne_driver.sample_rate,
+            window_size=mne_driver.num_samples)
+        store.append(mne_driver.signal_serial, mne_driver.window_begin_timestamp, mne_driver.mne_raw._data)
+        mne_driver.sequence += 1
+        return mne_driver
+
     @staticmethod
     def plot_data(mne_driver, *args, **kwargs):
         data_fig = mne_driver.mne_raw.plot(*args, **kwargs)
         if mne_driver.output_destination is not None:
             data_fig.savefig(mne_driver.get_path_name("data.png"))
+        plt.close(data_fig)
         mne_driver.sequence += 1
         return mne_driver
     
     @staticmethod
-    def record_psd(mne_driver, *args, **kwargs):
-        raise NotImplementedError("This method is not yet implemented.")
+    def render_data(mne_driver, scalings=None, **kwargs):
+        """
+        Plot the current data like plot_data, but with a figure whose layout is built
+        once per worker and only has its traces updated for every window.
+        """
+        if mne_driver.output_destination is not None:
+            Renderer.render_traces(
+                key=(mne_driver.output_destination, mne_driver.sequence, "data"),
+                path=mne_driver.get_path_name("data.png"),
+                times=mne_driver.mne_raw.times,
+                data=mne_driver.mne_raw._data,
+                labels=mne_driver.channels,
+                scalings=scalings)
+        mne_driver.sequence += 1
+        return mne_driver
+
+    @staticmethod
+    def render_psd(mne_driver, fmin=0, fmax=np.inf, **kwargs):
+        """
+        Plot the power spectral density like plot_psd, but with a figure whose layout
+        is built once per worker and only has its curves updated for every window.
+        """
+        psds, freqs = mne_driver.get_psd().get_data(return_freqs=True)
+        in_range = (freqs >= fmin) & (freqs <= fmax)
+        psds, freqs = psds[:, in_range], freqs[in_range]
+        if mne_driver.output_destination is not None:
+            Renderer.render_spectra(
+                key=(mne_driver.output_destination, mne_driver.sequence, "psd"),
+                path=mne_driver.get_path_name("psd.png"),
+                freqs=freqs,
+                psds=psds,
+                labels=mne_driver.channels)
+        mne_driver.sequence += 1
+        return mne_driver
+
+    @staticmethod
+    def record_psd(mne_driver, nperseg=None, noverlap=None, decay=1.0, **kwargs):
+        """
+        Record the power spectral density of the current data in the binary NumPy
+        format, without plotting it. The spectrum is estimated with Welch's method
+        over segments that continue across consecutive windows, and a running average
+        of all segments so far is recorded alongside it. Older windows can be given
+        less weight in the average with a decay factor below 1.
+        """
+        if nperseg is None:
+            nperseg = int(mne_driver.sample_rate)
+        if noverlap is None:
+            noverlap = nperseg // 2
+        key = (mne_driver.output_destination, mne_driver.sequence, "welch", nperseg, noverlap, decay)
+        welch = PSDEngine.update(
+            mne_driver.mne_raw._data, mne_driver.sample_rate, key, 
+            mne_driver.signal_serial, nperseg, noverlap, decay)
+        mne_driver.welch = welch
+
+        empty = np.empty((mne_driver.num_channels, 0), dtype=np.float32)
+        with open(mne_driver.get_path_name("psd.npz"), "wb") as file:
+            np.savez(
+                file,
+                channels=np.array(mne_driver.channels),
+                freqs=welch["freqs"].astype(np.float32),
+                window=welch["window"].astype(np.float32) if welch["window"] is not None else empty,
+                window_segments=welch["window_segments"],
+                average=welch["average"].astype(np.float32) if welch["average"] is not None else empty,
+                average_segments=welch["average_segments"],
+                signal_serial=mne_driver.signal_serial,
+                window_begin_time=str(mne_driver.window_begin_time))
+        mne_driver.sequence += 1
+        return mne_driver
 
     @staticmethod
     def plot_psd(mne_driver, *args, **kwargs):
-        psd_fig = mne_driver.mne_raw.compute_psd().plot(*args, **kwargs)
+        psd_fig = mne_driver.get_psd().plot(*args, **kwargs)
         if mne_driver.output_destination is not None:
             psd_fig.savefig(mne_driver.get_path_name("psd.png"))
+        plt.close(psd_fig)
         mne_driver.sequence += 1
         return mne_driver
 
     @staticmethod
     def plot_psds_topomap(mne_driver, *args, **kwargs):
-        plt.ion()
-        topomap_fig = mne_driver.mne_raw.compute_psd().plot_topomap(*args, **kwargs)   
+        topomap_fig = mne_driver.get_psd().plot_topomap(*args, **kwargs)   
         if mne_driver.output_destination is not None:
             topomap_fig.savefig(mne_driver.get_path_name("psds-topomap.png"))
+        plt.close(topomap_fig)
         mne_driver.sequence += 1
         return mne_driver
     
+    @staticmethod
+    def render_psds_topomap(mne_driver, bands=None, **kwargs):
+        """
+        Plot the power of each frequency band, in decibels, on the skull like
+        plot_psds_topomap, but with maps whose layout and interpolation are built once
+        per worker and only have their images updated for every window. bands maps
+        the title of each map to its (low, high) frequencies, and defaults to
+        MNEDriver.BANDS; bands above the Nyquist frequency are left out.
+        """
+        if bands is None:
+            bands = MNEDriver.BANDS
+        psds, freqs = mne_driver.get_psd().get_data(return_freqs=True)
+        titles, values = [], []
+        for title, (low, high) in bands.items():
+            in_band = (freqs >= low) & (freqs < high)
+            if in_band.any():
+                titles.append(title)
+                values.append(10 * np.log10(np.maximum(psds[:, in_band].mean(axis=1), np.finfo(float).tiny)))
+        if mne_driver.output_destination is not None and titles:
+            Renderer.render_topomaps(
+                key=(mne_driver.output_destination, mne_driver.sequence, "psds-topomap"),
+                path=mne_driver.get_path_name("psds-topomap.png"),
+                info=mne_driver.mne_info,
+                values=np.column_stack(values),
+                titles=titles,
+                symmetric=False)
+        mne_driver.sequence += 1
+        return mne_driver
+
     @staticmethod
     def plot_evoked(mne_driver, *args, **kwargs):
-        plt.ion()
         if mne_driver.evoked is None:
             MNEDriver.build_evoked(mne_driver)
         evoked_fig = mne_driver.evoked.plot(*args, **kwargs)
         if mne_driver.output_destination is not None:
             evoked_fig.savefig(mne_driver.get_path_name("evoked.png"))
+        plt.close(evoked_fig)
         mne_driver.sequence += 1
         return mne_driver
     
     @staticmethod
     def plot_topomap(mne_driver, *args, **kwargs):
-        plt.ion()
         if mne_driver.evoked is None:
             MNEDriver.build_evoked(mne_driver)
         topomap_fig = mne_driver.evoked.plot_topomap(*args, **kwargs)
         if mne_driver.output_destination is not None:
             topomap_fig.savefig(mne_driver.get_path_name("topomap.png"))
+        plt.close(topomap_fig)
+        mne_driver.sequence += 1
+        return mne_driver
+
+    @staticmethod
+    def render_topomap(mne_driver, times=None, **kwargs):
+        """
+        Plot the signal strengths at the given times of the window, in seconds, on the
+        skull like plot_topomap, but with maps whose layout and interpolation are built
+        once per worker and only have their images updated for every window. Four
+        evenly spaced times are drawn if none are given.
+        """
+        window_times = mne_driver.mne_raw.times
+        if times is None:
+            times = np.linspace(window_times[0], window_times[-1], 4)
+        indices = np.clip(np.searchsorted(window_times, np.atleast_1d(times)), 0, len(window_times) - 1)
+        if mne_driver.output_destination is not None:
+            Renderer.render_topomaps(
+                key=(mne_driver.output_destination, mne_driver.sequence, "topomap"),
+                path=mne_driver.get_path_name("topomap.png"),
+                info=mne_driver.mne_info,
+                values=mne_driver.mne_raw._data[:, indices],
+                titles=[f"{window_times[index]:.3f} s" for index in indices])
         mne_driver.sequence += 1
         return mne_driver
     
@@ -144,30 +365,89 @@ class MNEDriver:
     @staticmethod
     def filter(mne_driver, *args, **kwargs):
         mne_driver.mne_raw.filter(*args, **kwargs)
+        mne_driver.data_version += 1
         mne_driver.sequence += 1
         return mne_driver
     
     @staticmethod
     def notch_filter(mne_driver, *args, **kwargs):
         mne_driver.mne_raw.notch_filter(*args, **kwargs)
+        mne_driver.data_version += 1
         mne_driver.sequence += 1
         return mne_driver
     
+    @staticmethod
+    def stream_filter(mne_driver, l_freq=None, h_freq=None, order=4, **kwargs):
+        """
+        Apply a Butterworth high-pass, low-pass, or band-pass filter that carries its
+        state across consecutive windows, instead of filtering each window on its own.
+        This also works on windows shorter than the filters of MNEDriver.filter.
+        """
+        sos = StreamingFilter.design_pass(l_freq, h_freq, mne_driver.sample_rate, order)
+        key = (mne_driver.output_destination, mne_driver.sequence, "pass", l_freq, h_freq, order)
+        mne_driver.mne_raw._data[:] = StreamingFilter.apply(
+            sos, mne_driver.mne_raw._data, key, mne_driver.signal_serial)
+        mne_driver.data_version += 1
+        mne_driver.sequence += 1
+        return mne_driver
+
+    @staticmethod
+    def stream_notch_filter(mne_driver, freqs, quality=30.0, **kwargs):
+        """
+        Apply IIR notch filters at the given frequencies, carrying their state across
+        consecutive windows.
+        """
+        freqs = tuple(np.atleast_1d(freqs).tolist())
+        sos = StreamingFilter.design_notch(freqs, mne_driver.sample_rate, quality)
+        key = (mne_driver.output_destination, mne_driver.sequence, "notch", freqs, quality)
+        mne_driver.mne_raw._data[:] = StreamingFilter.apply(
+            sos, mne_driver.mne_raw._data, key, mne_driver.signal_serial)
+        mne_driver.data_version += 1
+        mne_driver.sequence += 1
+        return mne_driver
+
+    @staticmethod
+    def stream_cascade(mne_driver, sos, stages=1, **kwargs):
+        """
+        Apply a cascade of second-order sections in a single pass, carrying its state
+        across consecutive windows. Frame.wrap fuses consecutive stream_filter,
+        stream_notch_filter and short stream_moving_average stages into one such
+        stage, which counts as the given number of stages, so that the names of the
+        files written by later stages do not change.
+        """
+        key = (mne_driver.output_destination, mne_driver.sequence, "cascade", stages, sos.shape[0])
+        mne_driver.mne_raw._data[:] = StreamingFilter.apply(
+            sos, mne_driver.mne_raw._data, key, mne_driver.signal_serial)
+        mne_driver.data_version += 1
+        mne_driver.sequence += stages
+        return mne_driver
+
     @staticmethod
     def ica(mne_driver, *args, **kwargs):
         raise NotImplementedError("This method is not yet implemented.")
     
     @staticmethod
     def savgol_filter(mne_driver, *args, **kwargs):
-        filtered_data = np.empty_like(mne_driver.mne_raw._data)
-        for i in range(len(mne_driver.mne_raw.ch_names)):
-            filtered_data[i, :] = scipy_savgol(mne_driver.mne_raw._data[i, :], *args, **kwargs)
-            mne_driver.mne_raw._data[i, :] -= filtered_data[i, :]
+        filtered_data = scipy_savgol(mne_driver.mne_raw._data, *args, axis=-1, **kwargs)
+        mne_driver.mne_raw._data -= filtered_data
+        mne_driver.data_version += 1
 
     @staticmethod
     def moving_average_smoothening(mne_driver, *args, **kwargs):
         window_size = kwargs.get("window", 5)
-        for i in range(len(mne_driver.mne_raw.ch_names)):
-            window = np.ones(window_size) / window_size
-            mne_driver.mne_raw._data[i, :] = np.convolve(mne_driver.mne_raw._data[i, :], window, 'same')
-    
+        mne_driver.mne_raw._data[:] = uniform_filter1d(
+            mne_driver.mne_raw._data, window_size, axis=-1, mode="constant", cval=0.0)
+        mne_driver.data_version += 1
+
+    @staticmethod
+    def stream_moving_average(mne_driver, window=5, **kwargs):
+        """
+        Smoothen the curves with a trailing moving average that continues across
+        consecutive windows, instead of padding each window with zeros.
+        """
+        key = (mne_driver.output_destination, mne_driver.sequence, "moving-average", window)
+        mne_driver.mne_raw._data[:] = StreamingFilter.moving_average(
+            mne_driver.mne_raw._data, window, key, mne_driver.signal_serial)
+        mne_driver.data_version += 1
+        mne_driver.sequence += 1
+        return mne_driver
@@ -0,0 +1,81 @@
+import numpy as np
+from scipy import signal
+
+
+class PSDEngine:
+    """
+    The PSDEngine class estimates power spectral densities with Welch's method
+    across consecutive windows. The samples left over after the last full segment
+    of a window are kept, so that the overlapping segments continue into the next
+    window as if the signal were never cut. For every key, the engine keeps a running
+    average of all segments seen so far, optionally forgetting older windows with a
+    decay factor. States are kept per process, like those of StreamingFilter, so
+    Frame runs every window of a pipeline recording them on the same worker.
+    """
+
+    states: dict[tuple, dict] = dict()      # Key -> tail, serial of the next expected sample, sums
+
+    def __init__(self) -> None:
+        raise TypeError("The PSDEngine class is a static class, and cannot be initialized.")
+
+    @staticmethod
+    def update(
+            data: np.ndarray,
+            sample_rate: float,
+            key: tuple,
+            signal_serial: int,
+            nperseg: int,
+            noverlap: int,
+            decay: float = 1.0,
+            ) -> dict:
+        """
+        Feed a (channels x samples) window into the running Welch estimate of the
+        given key. signal_serial is the serial of the last sample of the window.
+        Returns a dictionary with the frequencies, the spectrum of the segments ending
+        in this window ("window", None if no segment ended), the running average
+        ("average"), and the number of segments each of them is based on.
+        """
+        if not 0 <= noverlap < nperseg:
+            raise ValueError("noverlap must be non-negative and smaller than nperseg.")
+        step = nperseg - noverlap
+        first_serial = signal_serial - data.shape[-1] + 1
+        state = PSDEngine.states.get(key)
+        if state is None or state["params"] != (data.shape[0], nperseg, noverlap, sample_rate):
+            state = {
+                "params": (data.shape[0], nperseg, noverlap, sample_rate),
+                "tail": None,
+                "next_serial": None,
+                "sum": None,
+                "count": 0.0}
+            PSDEngine.states[key] = state
+
+        if state["tail"] is not None and state["next_serial"] == first_serial:
+            extended = np.concatenate([state["tail"], data], axis=-1)
+        else:
+            extended = data
+
+        num_segments = (extended.shape[-1] - nperseg) // step + 1 if extended.shape[-1] >= nperseg else 0
+        freqs = np.fft.rfftfreq(nperseg, 1 / sample_rate)
+        window_psd = None
+        if num_segments > 0:
+            used = (num_segments - 1) * step + nperseg
+            freqs, window_psd = signal.welch(
+                extended[:, :used], fs=sample_rate, nperseg=nperseg, noverlap=noverlap, axis=-1)
+            if state["sum"] is None:
+                state["sum"] = np.zeros_like(window_psd)
+            state["sum"] = state["sum"] * decay + window_psd * num_segments
+            state["count"] = state["count"] * decay + num_segments
+
+        state["tail"] = extended[:, num_segments * step:].copy()
+        state["next_serial"] = signal_serial + 1
+        return {
+            "freqs": freqs,
+            "window": window_psd,
+            "window_segments": num_segments,
+            "average": state["sum"] / state["count"] if state["count"] > 0 else None,
+            "average_segments": state["count"],
+        }
+
+    @staticmethod
+    def reset() -> None:
+        PSDEngine.states = dict()
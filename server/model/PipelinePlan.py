@@ -0,0 +1,204 @@
+import inspect
+import numpy as np
+from model.Metrics import Metrics
+from model.MNEDriver import MNEDriver
+from model.StreamingFilter import StreamingFilter
+
+
+class PipelineStep:
+    """
+    The PipelineStep class is a single stage of a compiled pipeline: a function of
+    the MNEDriver with its keyword arguments resolved once. Only the serial of the
+    window, for stages with "cascade_output", is added when it is called.
+    """
+
+    def __init__(self, name: str, function: callable, kwargs: dict, pass_serial: bool = False) -> None:
+        self.name = name
+        self.function = function
+        self.kwargs = kwargs
+        self.pass_serial = pass_serial
+
+    def __call__(self, mne_driver: MNEDriver) -> None:
+        if self.pass_serial:
+            self.function(mne_driver, signal_serial=mne_driver.signal_serial, **self.kwargs)
+        else:
+            self.function(mne_driver, **self.kwargs)
+
+    def __repr__(self) -> str:
+        return f"PipelineStep({self.name})"
+
+
+class PipelinePlan:
+    """
+    The PipelinePlan class compiles the pipeline given to Frame.wrap, a list of
+    functions or (function, kwargs) tuples, into the steps run on every window. The
+    pipeline is checked once, so that a bad configuration fails before acquisition
+    starts rather than in a worker, and then:
+
+        - the keyword arguments of every stage are copied and resolved up front,
+          with output_destination added for stages with "cascade_output";
+        - runs of consecutive stream_filter, stream_notch_filter and short
+          stream_moving_average stages are fused into one stream_cascade stage,
+          which filters the window in a single pass;
+        - Metrics.take_snapshot stages whose snapshot no later stage reads are left
+          out, since the snapshots only live in the worker processes.
+    """
+
+    STREAM_FILTERS = (MNEDriver.stream_filter, MNEDriver.stream_notch_filter, MNEDriver.stream_moving_average)
+    MAX_FUSED_MOVING_AVERAGE = 16               # Longer averages are cheaper as running sums than as sections
+    STATEFUL = (MNEDriver.stream_filter, MNEDriver.stream_notch_filter, MNEDriver.stream_moving_average,
+                MNEDriver.stream_cascade, MNEDriver.record_psd)
+
+    def __init__(self, steps: list[PipelineStep]) -> None:
+        self.steps = steps
+
+    @property
+    def stateful(self) -> bool:
+        """
+        Whether any step keeps state in the worker process from one window to the
+        next, so that every window must run on the same worker, in order.
+        """
+        return any(step.function in PipelinePlan.STATEFUL for step in self.steps)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    @staticmethod
+    def compile(pipeline: list, sample_rate: float, output_destination: str) -> "PipelinePlan":
+        """
+        Compile a pipeline for a frame of the given sample rate and output destination.
+        Raises a ValueError naming the first stage that is not valid.
+        """
+        stages = [PipelinePlan._resolve(index, entry, output_destination) for index, entry in enumerate(pipeline)]
+        sections = [PipelinePlan._design(stage, sample_rate) for stage in stages]
+        PipelinePlan._check_names(stages)
+        stages, sections = PipelinePlan._drop_unread_snapshots(stages, sections)
+        return PipelinePlan(PipelinePlan._fuse_filters(stages, sections))
+
+    @staticmethod
+    def _resolve(index: int, entry, output_destination: str) -> dict:
+        # Turn an entry of the pipeline into its function and a copy of its arguments
+        if type(entry) is tuple:
+            if len(entry) != 2 or not callable(entry[0]) or not isinstance(entry[1], dict):
+                raise ValueError(f"Stage {index} of the pipeline must be a function or a (function, kwargs) tuple.")
+            function, kwargs = entry[0], dict(entry[1])
+        elif callable(entry):
+            function, kwargs = entry, dict()
+        else:
+            raise ValueError(f"Stage {index} of the pipeline must be a function or a (function, kwargs) tuple.")
+
+        name = getattr(function, "__name__", type(function).__name__)
+        pass_serial = bool(kwargs.pop("cascade_output", False))
+        if pass_serial:
+            kwargs["output_destination"] = output_destination
+        try:
+            signature = inspect.signature(function)
+        except (TypeError, ValueError):
+            signature = None                            # Such as built-in functions, which are not checked
+        if signature is not None:
+            try:
+                signature.bind(None, **dict(kwargs, signal_serial=0) if pass_serial else kwargs)
+            except TypeError as error:
+                raise ValueError(f"Stage {index} of the pipeline ({name}) cannot be called with {kwargs}: {error}")
+        return {"index": index, "name": name, "function": function, "kwargs": kwargs, "pass_serial": pass_serial}
+
+    @staticmethod
+    def _design(stage: dict, sample_rate: float) -> np.ndarray|None:
+        # Design the filter of a streaming filter stage, or None if it cannot be fused
+        function, kwargs = stage["function"], stage["kwargs"]
+        if function not in PipelinePlan.STREAM_FILTERS:
+            return None
+        try:
+            if function is MNEDriver.stream_filter:
+                return StreamingFilter.design_pass(
+                    kwargs.get("l_freq"), kwargs.get("h_freq"), sample_rate, kwargs.get("order", 4))
+            if function is MNEDriver.stream_notch_filter:
+                freqs = tuple(np.atleast_1d(kwargs["freqs"]).tolist())
+                return StreamingFilter.design_notch(freqs, sample_rate, kwargs.get("quality", 30.0))
+            window = kwargs.get("window", 5)
+            if not isinstance(window, (int, np.integer)) or window < 1:
+                raise ValueError("The window of a moving average must be a positive number of samples.")
+            if window < 2 or window > PipelinePlan.MAX_FUSED_MOVING_AVERAGE:
+                return None
+            return StreamingFilter.design_moving_average(int(window))
+        except ValueError as error:
+            raise ValueError(f"Stage {stage['index']} of the pipeline ({stage['name']}) is not valid: {error}")
+
+    @staticmethod
+    def _check_names(stages: list[dict]) -> None:
+        # Stages writing to named places must not overwrite each other, or read what is never written
+        sessions = set()
+        snapshots = set()
+        for stage in stages:
+            function, kwargs = stage["function"], stage["kwargs"]
+            if function is MNEDriver.record_session:
+                name = kwargs.get("name", "session")
+                if name in sessions:
+                    raise ValueError(f"Stage {stage['index']} of the pipeline records a second session named {name}.")
+                sessions.add(name)
+            elif function is Metrics.take_snapshot:
+                snapshots.add((id(kwargs["metrics"]), kwargs["name"]))
+
+        for stage in stages:
+            kwargs = stage["kwargs"]
+            if "metrics" not in kwargs or "snapshots" not in kwargs:
+                continue
+            for name in kwargs["snapshots"]:
+                if (id(kwargs["metrics"]), name) not in snapshots:
+                    raise ValueError(f"Stage {stage['index']} of the pipeline ({stage['name']}) reads the snapshot "
+                                     f"{name}, which no stage takes.")
+
+    @staticmethod
+    def _reads_snapshot(stage: dict, metrics, name: str) -> bool|None:
+        # Whether a stage reads the snapshot, False if it discards it, and None if it does not touch it
+        function, kwargs = stage["function"], stage["kwargs"]
+        if kwargs.get("metrics") is not metrics:
+            return None
+        if function is Metrics.take_snapshot:
+            return False if kwargs["name"] == name else None
+        if function is Metrics.clear_snapshots:
+            return False
+        if "snapshots" in kwargs:
+            return True if name in kwargs["snapshots"] else None
+        return True                                     # Any other use of the metrics may read every snapshot
+
+    @staticmethod
+    def _drop_unread_snapshots(stages: list[dict], sections: list) -> tuple[list[dict], list]:
+        kept_stages, kept_sections = [], []
+        for position, (stage, sos) in enumerate(zip(stages, sections)):
+            if stage["function"] is Metrics.take_snapshot:
+                metrics, name = stage["kwargs"]["metrics"], stage["kwargs"]["name"]
+                read = False
+                for later in stages[position + 1:]:
+                    reads = PipelinePlan._reads_snapshot(later, metrics, name)
+                    if reads is not None:
+                        read = reads
+                        break
+                if not read:
+                    continue
+            kept_stages.append(stage)
+            kept_sections.append(sos)
+        return kept_stages, kept_sections
+
+    @staticmethod
+    def _fuse_filters(stages: list[dict], sections: list) -> list[PipelineStep]:
+        steps = []
+        position = 0
+        while position < len(stages):
+            end = position
+            while end < len(stages) and sections[end] is not None:
+                end += 1
+            if end - position >= 2:
+                steps.append(PipelineStep(
+                    name="+".join(stage["name"] for stage in stages[position:end]),
+                    function=MNEDriver.stream_cascade,
+                    kwargs={"sos": np.vstack(sections[position:end]), "stages": end - position}))
+                position = end
+                continue
+            stage = stages[position]
+            steps.append(PipelineStep(stage["name"], stage["function"], stage["kwargs"], stage["pass_serial"]))
+            position += 1
+        return steps
@@ -0,0 +1,222 @@
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+import mne
+import numpy as np
+
+
+class Renderer:
+    """
+    The Renderer class draws the figures of the pipeline headless with the Agg
+    backend. The layout of each figure (axes, labels, one line per channel) is built
+    and drawn only once per process and key; later windows only update the line data,
+    draw the lines over the cached background, and write the pixels out with fast
+    PNG compression. The background is drawn again only when the axis limits change.
+    Topomaps work the same way, with one image per map: since the interpolation of
+    the channels onto the head is linear, it is computed once per channel set as a
+    matrix, and every window only updates the image data.
+    Figures are created without pyplot, so nothing keeps them alive besides the
+    Renderer, and memory stays bounded over long sessions.
+    """
+
+    figures: dict[tuple, dict] = dict()      # Key -> figure, canvas, axes and lines, per process
+    interpolations: dict[tuple, np.ndarray] = dict()    # Channels and positions -> (pixels x channels) matrix
+
+    def __init__(self) -> None:
+        raise TypeError("The Renderer class is a static class, and cannot be initialized.")
+
+    @staticmethod
+    def _get_figure(key: tuple, num_lines: int, labels: list[str], size: tuple[float, float], dpi: int) -> dict:
+        entry = Renderer.figures.get(key)
+        if entry is not None and len(entry["lines"]) == num_lines:
+            return entry
+        if entry is not None:
+            Renderer.close(key)
+
+        figure = Figure(figsize=size, dpi=dpi)
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_subplot(1, 1, 1)
+        lines = [axes.plot([], [], linewidth=0.8, label=label)[0] for label in labels]
+        entry = {"figure": figure, "canvas": canvas, "axes": axes, "lines": lines, "artists": lines, "overlays": []}
+        Renderer.figures[key] = entry
+        return entry
+
+    @staticmethod
+    def _set_limits(entry: dict, xlim: tuple[float, float], ylim: tuple[float, float]) -> None:
+        if entry.get("limits") != (xlim, ylim):
+            entry["axes"].set_xlim(*xlim)
+            entry["axes"].set_ylim(*ylim)
+            entry["limits"] = (xlim, ylim)
+            entry["background"] = None
+
+    @staticmethod
+    def _write(entry: dict, path: str) -> None:
+        # The artists change with every window; the overlays are drawn again over them
+        canvas = entry["canvas"]
+        if entry.get("background") is None:
+            for artist in entry["artists"]:
+                artist.set_visible(False)
+            canvas.draw()
+            entry["background"] = canvas.copy_from_bbox(entry["figure"].bbox)
+            for artist in entry["artists"]:
+                artist.set_visible(True)
+
+        canvas.restore_region(entry["background"])
+        for artist in entry["artists"] + entry["overlays"]:
+            artist.axes.draw_artist(artist)
+        image = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        image.save(path, format="png", compress_level=1)
+
+    @staticmethod
+    def render_traces(
+            key: tuple,
+            path: str,
+            times: np.ndarray,
+            data: np.ndarray,
+            labels: list[str],
+            scalings: float|None = None,
+            size: tuple[float, float] = (10, 6),
+            dpi: int = 80,
+            ) -> None:
+        """
+        Draw each channel of a (channels x samples) window as a trace stacked under
+        the previous one, like a raw data browser, and write the figure to path.
+        scalings is the amplitude drawn as half of the spacing between two traces;
+        if not given, it is derived from the window itself.
+        """
+        num_channels = data.shape[0]
+        entry = Renderer._get_figure(key, num_channels, labels, size, dpi)
+        axes = entry["axes"]
+        if "offsets" not in entry:
+            entry["offsets"] = np.arange(num_channels)[::-1].astype(float)
+            axes.set_yticks(entry["offsets"])
+            axes.set_yticklabels(labels)
+            axes.set_xlabel("Time (s)")
+
+        centered = data - data.mean(axis=-1, keepdims=True)
+        if scalings is None:
+            scalings = float(np.percentile(np.abs(centered), 99)) or 1.0
+        traces = centered / (2 * scalings)
+        for line, offset, trace in zip(entry["lines"], entry["offsets"], traces):
+            line.set_data(times, trace + offset)
+        Renderer._set_limits(entry, (float(times[0]), float(times[-1])), (-1.0, float(num_channels)))
+        Renderer._write(entry, path)
+
+    @staticmethod
+    def render_spectra(
+            key: tuple,
+            path: str,
+            freqs: np.ndarray,
+            psds: np.ndarray,
+            labels: list[str],
+            size: tuple[float, float] = (10, 4),
+            dpi: int = 80,
+            ) -> None:
+        """
+        Draw one power spectral density curve per channel, in decibels, and write the
+        figure to path. The power axis is only widened, in steps of 10 dB, when a
+        spectrum does not fit, so that the background rarely has to be drawn again.
+        """
+        entry = Renderer._get_figure(key, psds.shape[0], labels, size, dpi)
+        axes = entry["axes"]
+        if "decorated" not in entry:
+            axes.set_xlabel("Frequency (Hz)")
+            axes.set_ylabel("Power (dB)")
+            entry["decorated"] = True
+
+        psds_db = 10 * np.log10(np.maximum(psds, np.finfo(float).tiny))
+        for line, psd_db in zip(entry["lines"], psds_db):
+            line.set_data(freqs, psd_db)
+
+        low = 10 * np.floor(psds_db.min() / 10)
+        high = 10 * np.ceil(psds_db.max() / 10)
+        if entry.get("limits") is not None:
+            low = min(low, entry["limits"][1][0])
+            high = max(high, entry["limits"][1][1])
+        Renderer._set_limits(entry, (float(freqs[0]), float(freqs[-1])), (float(low), float(high)))
+        Renderer._write(entry, path)
+
+    @staticmethod
+    def _get_interpolation(info: mne.Info) -> np.ndarray:
+        # The topomap image of any values is this matrix times the values, so it is
+        # found once by plotting each channel alone, through the public MNE API
+        key = (tuple(info.ch_names), tuple(tuple(channel["loc"][:3]) for channel in info["chs"]))
+        if key not in Renderer.interpolations:
+            figure = Figure()
+            axes = figure.add_subplot(1, 1, 1)
+            columns = []
+            for channel in range(len(info.ch_names)):
+                axes.clear()
+                values = np.zeros(len(info.ch_names))
+                values[channel] = 1.0
+                image, _ = mne.viz.plot_topomap(values, info, axes=axes, show=False, contours=0)
+                columns.append(np.ma.filled(image.get_array().astype(float), 0.0).ravel())
+            figure.clear()
+            Renderer.interpolations[key] = np.array(columns).T
+        return Renderer.interpolations[key]
+
+    @staticmethod
+    def _get_topomaps(key: tuple, info: mne.Info, titles: list[str], size: tuple[float, float], dpi: int) -> dict:
+        entry = Renderer.figures.get(key)
+        if entry is not None and entry["titles"] == titles:
+            return entry
+        if entry is not None:
+            Renderer.close(key)
+
+        figure = Figure(figsize=size, dpi=dpi)
+        canvas = FigureCanvasAgg(figure)
+        images, overlays = [], []
+        for index, title in enumerate(titles):
+            axes = figure.add_subplot(1, len(titles), index + 1)
+            image, _ = mne.viz.plot_topomap(np.zeros(len(info.ch_names)), info, axes=axes, show=False, contours=0)
+            axes.set_title(title, fontsize=10)
+            images.append(image)
+            overlays.extend(axes.lines + axes.collections)      # Head outline and sensors
+        entry = {
+            "figure": figure, "canvas": canvas, "images": images, "artists": images, "overlays": overlays,
+            "titles": titles, "interpolation": Renderer._get_interpolation(info)}
+        Renderer.figures[key] = entry
+        return entry
+
+    @staticmethod
+    def render_topomaps(
+            key: tuple,
+            path: str,
+            info: mne.Info,
+            values: np.ndarray,
+            titles: list[str],
+            symmetric: bool = True,
+            size: tuple[float, float]|None = None,
+            dpi: int = 80,
+            ) -> None:
+        """
+        Draw one topomap per column of a (channels x maps) array of values, with the
+        given titles, and write the figure to path. The colors of each map span
+        -max to max of its absolute values if symmetric, or its minimum to maximum.
+        """
+        if size is None:
+            size = (2.5 * len(titles), 2.8)
+        entry = Renderer._get_topomaps(key, info, list(titles), size, dpi)
+        interpolation = entry["interpolation"]
+        for image, column in zip(entry["images"], values.T):
+            shape = image.get_array().shape
+            image.set_data((interpolation @ column).reshape(shape))
+            if symmetric:
+                limit = float(np.abs(column).max()) or 1.0
+                image.set_clim(-limit, limit)
+            else:
+                image.set_clim(float(column.min()), float(column.max()) + np.finfo(float).eps)
+        Renderer._write(entry, path)
+
+    @staticmethod
+    def close(key: tuple) -> None:
+        entry = Renderer.figures.pop(key, None)
+        if entry is not None:
+            entry["figure"].clear()
+
+    @staticmethod
+    def close_all() -> None:
+        for key in list(Renderer.figures):
+            Renderer.close(key)
@@ -0,0 +1,66 @@
+import time
+
+
+class ReplayClock:
+    """
+    The ReplayClock class paces the replay of a file at a given sample rate. Rather
+    than sleeping a fixed time after every sample, which the operating system cannot
+    deliver at high rates and whose errors add up, it sleeps until the monotonic
+    deadline of the samples emitted so far. Samples are emitted in batches that span
+    about one sleep granularity, so that the replay keeps up with the device rate on
+    average. A speed of None replays as fast as possible.
+    """
+
+    def __init__(self, sample_rate: float|None, speed: float|None = 1.0, granularity: float = 0.005) -> None:
+        if speed is not None and speed <= 0:
+            raise ValueError("The replay speed must be positive, or None for maximum speed.")
+        self.sample_rate = sample_rate
+        self.speed = speed if sample_rate is not None else None
+        self.granularity = granularity
+        self.start_time = None
+        self.emitted = 0
+
+    def start(self) -> None:
+        self.start_time = time.monotonic()
+        self.emitted = 0
+
+    def batch_size(self, default: int) -> int:
+        """
+        Get the number of samples that should be emitted between two waits; at maximum
+        speed, this is the given default.
+        """
+        if self.speed is None:
+            return default
+        return max(1, int(round(self.sample_rate * self.speed * self.granularity)))
+
+    def wait(self, num_samples: int) -> None:
+        """
+        Account for num_samples newly emitted samples, and sleep until they are due.
+        """
+        if self.start_time is None:
+            self.start()
+        self.emitted += num_samples
+        if self.speed is None:
+            return
+        delay = self.deadline() - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def deadline(self) -> float:
+        return self.start_time + self.emitted / (self.sample_rate * self.speed)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Get the number of samples emitted, the time elapsed, the achieved sample rate,
+        and the lag in seconds behind the schedule (negative when ahead of it).
+        """
+        if self.start_time is None:
+            return {"emitted": 0, "elapsed": 0.0, "achieved_rate": 0.0, "lag": 0.0}
+        now = time.monotonic()
+        elapsed = now - self.start_time
+        return {
+            "emitted": self.emitted,
+            "elapsed": elapsed,
+            "achieved_rate": self.emitted / elapsed if elapsed > 0 else 0.0,
+            "lag": now - self.deadline() if self.speed is not None else 0.0,
+        }
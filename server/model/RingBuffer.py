@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    The RingBuffer class holds the most recent samples of every channel in one
+    preallocated (channels x capacity) NumPy array. Each sample is written twice,
+    once at its position and once at its position plus the capacity, so that the
+    latest n samples are always a single contiguous slice of the array and can be
+    read out as a view without any per-sample Python objects.
+    """
+
+    def __init__(self, num_channels: int, capacity: int, dtype: str = "float64") -> None:
+        if capacity <= 0:
+            raise ValueError("The capacity of the ring buffer must be positive.")
+        self.num_channels = num_channels
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError("The dtype of the ring buffer must be float32 or float64.")
+        self.data = np.zeros((num_channels, 2 * capacity), dtype=self.dtype)
+        self.head = 0                                       # Position of the next write
+        self.size = 0                                       # Number of valid samples held
+
+    def extend(self, block: np.ndarray) -> None:
+        """
+        Append a (channels x n) block of samples. If the block is longer than the 
+        capacity, only its last capacity samples are kept.
+        """
+        num_samples = block.shape[1]
+        if num_samples >= self.capacity:
+            block = block[:, -self.capacity:]
+            self.data[:, :self.capacity] = block
+            self.data[:, self.capacity:] = block
+            self.head = 0
+            self.size = self.capacity
+            return
+
+        first = min(num_samples, self.capacity - self.head)
+        self.data[:, self.head:self.head + first] = block[:, :first]
+        self.data[:, self.head + self.capacity:self.head + self.capacity + first] = block[:, :first]
+        rest = num_samples - first
+        if rest > 0:
+            self.data[:, :rest] = block[:, first:]
+            self.data[:, self.capacity:self.capacity + rest] = block[:, first:]
+        self.head = (self.head + num_samples) % self.capacity
+        self.size = min(self.size + num_samples, self.capacity)
+
+    def latest(self, num_samples: int) -> np.ndarray:
+        """
+        Return a read-only (channels x num_samples) view of the latest samples. The
+        view is only valid until the buffer is written again; copy it if it has to
+        outlive the next extend.
+        """
+        if num_samples > self.size:
+            raise ValueError(f"Only {self.size} samples are held, but {num_samples} were requested.")
+        end = self.head + self.capacity
+        view = self.data[:, end - num_samples:end]
+        view.flags.writeable = False
+        return view
+
+    def __len__(self) -> int:
+        return self.size
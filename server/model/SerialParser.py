@@ -0,0 +1,134 @@
+import numpy as np
+
+
+class SerialParser:
+    """
+    The SerialParser class incrementally parses the bytes read from the serial port
+    of the board into blocks of samples. Bytes of a packet that is not complete yet
+    are kept until the next read. Two framings are supported:
+
+    - "text": Packets of the form "||<serial>|<comma-separated-channel-values>", as
+      described in the README, ended by a line break.
+    - "binary": Frames of 0xA5 0x5A, the serial (uint8), the number of channels
+      (uint8), one little-endian int16 per channel, and a checksum byte (the sum of
+      the serial, channel count and value bytes, modulo 256). Values are multiplied
+      by binary_scale. The parser resynchronizes on the next 0xA5 0x5A after a
+      corrupted frame.
+
+    The serial of each packet is a counter wrapping around at sequence_modulo. A
+    packet repeating the previous serial is dropped as a duplicate, and skipped
+    serials are counted as gaps.
+    """
+
+    SYNC = b"\xa5\x5a"
+    FRAMINGS = ("text", "binary")
+
+    def __init__(self, framing: str = "text", sequence_modulo: int = 100, binary_scale: float = 1.0) -> None:
+        if framing not in SerialParser.FRAMINGS:
+            raise ValueError(f"The framing must be one of {SerialParser.FRAMINGS}.")
+        self.framing = framing
+        self.sequence_modulo = sequence_modulo
+        self.binary_scale = binary_scale
+        self.buffer = bytearray()
+        self.num_channels = None                    # Taken from the first valid packet
+        self.last_serial = None
+        self.stats = {"packets": 0, "duplicates": 0, "gaps": 0, "missing": 0, "parse_errors": 0}
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Parse newly read bytes, and return the (channels x n) block of the new samples
+        they complete; n may be 0.
+        """
+        self.buffer += data
+        if self.framing == "text":
+            serials, values = self._parse_text()
+        else:
+            serials, values = self._parse_binary()
+        if len(serials) == 0:
+            return np.empty((self.num_channels or 0, 0))
+        keep = self._track_sequence(serials)
+        return values[keep].T
+
+    def _track_sequence(self, serials: np.ndarray) -> np.ndarray:
+        keep = np.ones(len(serials), dtype=bool)
+        for i, serial in enumerate(serials.tolist()):
+            if self.last_serial is not None:
+                step = (serial - self.last_serial) % self.sequence_modulo
+                if step == 0:
+                    keep[i] = False
+                    self.stats["duplicates"] += 1
+                    continue
+                if step > 1:
+                    self.stats["gaps"] += 1
+                    self.stats["missing"] += step - 1
+            self.last_serial = serial
+        self.stats["packets"] += int(keep.sum())
+        return keep
+
+    def _parse_text(self) -> tuple[np.ndarray, np.ndarray]:
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            return np.empty(0, dtype=int), None
+        complete = bytes(self.buffer[:end])
+        del self.buffer[:end + 1]
+
+        serials, rows = [], []
+        for packet in complete.decode("utf-8", errors="replace").replace("\r", "").replace("\n", "").split("||"):
+            if packet == "":
+                continue
+            try:
+                serial, signals = packet.split("|")
+                row = signals.strip(",").split(",")
+                if self.num_channels is None:
+                    self.num_channels = len(row)
+                if len(row) < self.num_channels:
+                    raise ValueError("Too few channel values.")
+                values = [float(value) for value in row[:self.num_channels]]    # Only this packet is lost if bad
+                serials.append(int(serial))
+                rows.append(values)
+            except ValueError:
+                self.stats["parse_errors"] += 1
+        if len(serials) == 0:
+            return np.empty(0, dtype=int), None
+        return np.array(serials), np.array(rows, dtype=float)
+
+    def _parse_binary(self) -> tuple[np.ndarray, np.ndarray]:
+        serials, values = [], []
+        while True:
+            start = self.buffer.find(SerialParser.SYNC)
+            if start < 0:
+                del self.buffer[:max(0, len(self.buffer) - 1)]       # Keep a byte that may start a sync
+                break
+            if start > 0:
+                self.stats["parse_errors"] += 1
+                del self.buffer[:start]
+            if len(self.buffer) < 4:
+                break
+            num_channels = self.buffer[3]
+            frame_size = 5 + 2 * num_channels
+            if len(self.buffer) < frame_size:
+                break
+
+            # Decode the run of well-formed frames of the same size at once
+            count = len(self.buffer) // frame_size
+            frames = np.frombuffer(bytes(self.buffer[:count * frame_size]), dtype=np.uint8).reshape(count, frame_size)
+            checksums = frames[:, 2:-1].sum(axis=1, dtype=np.uint32) % 256
+            valid = ((frames[:, 0] == 0xA5) & (frames[:, 1] == 0x5A)
+                     & (frames[:, 3] == num_channels) & (checksums == frames[:, -1]))
+            run = count if valid.all() else int(np.argmin(valid))
+            if run == 0:
+                self.stats["parse_errors"] += 1
+                del self.buffer[:1]                                    # Resynchronize on the next sync
+                continue
+            if self.num_channels is None:
+                self.num_channels = num_channels
+            if num_channels != self.num_channels:
+                self.stats["parse_errors"] += run
+            else:
+                serials.append(frames[:run, 2].astype(int))
+                values.append(frames[:run, 4:-1].copy().view("<i2").astype(float) * self.binary_scale)
+            del self.buffer[:run * frame_size]
+
+        if len(serials) == 0:
+            return np.empty(0, dtype=int), None
+        return np.concatenate(serials), np.vstack(values)
@@ -1,60 +1,66 @@
-import os
-import base64
-from fastapi import FastAPI
+import hashlib, os
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-import threading
-import time
-
-class FolderMonitor(threading.Thread):
-    def __init__(self, server, folder_path, folder_name):
-        threading.Thread.__init__(self)
-        self.server = server
-        self.folder_path = folder_path
-        self.folder_name = folder_name
-        self.stop_flag = threading.Event()
-
-    def run(self):
-        while not self.stop_flag.is_set():
-            files_in_folder = [f for f in os.listdir(self.folder_path) if os.path.isfile(os.path.join(self.folder_path, f))]
-            if len(files_in_folder) >= self.server.num_files:
-                self.server.add_subfolder(self.folder_name)
-                print(f"Folder {self.folder_name} added to subfolders list")
-                break
-            time.sleep(0.1)  # Check every second
-
-    def stop(self):
-        self.stop_flag.set()
-
-class NewFolderHandler(FileSystemEventHandler):
-    def __init__(self, server):
-        self.server = server
-        self.monitors = {}
-
-    def on_created(self, event):
-        if event.is_directory:
-            new_folder_name = os.path.basename(event.src_path)
-            print(f"New folder detected: {new_folder_name}")
-            
-            monitor = FolderMonitor(self.server, event.src_path, new_folder_name)
-            self.monitors[new_folder_name] = monitor
-            monitor.start()
+import uvicorn, json, queue, threading, time, traceback
+from collections import OrderedDict
+import numpy as np
+from model.ArtifactCache import Artifact, ArtifactCache
+from model.Decimation import Decimation
+from model.EventBroadcaster import EventBroadcaster
+from model.SessionStore import SessionStore
+from model.Telemetry import Telemetry
+from model.WindowIndex import WindowIndex
 
 class Server:
+    """
+    The Server class serves the results of one or more sessions, each of them the
+    output of one Frame, to the front-end portal. Every session is registered under
+    a name, and its routes are namespaced under /sessions/{name}. The routes at the
+    root, such as /latest, serve the first session registered, as they always have.
+    Frames notify the server of every window their workers complete, with the
+    names of its artifacts, which are then read once into an in-memory LRU cache,
+    from which all routes serve them, and every completed window is pushed to the
+    clients subscribed to /events as a Server-Sent Event. The raw signals
+    of the latest windows are also kept in memory, and served as float32 binary, so
+    that clients can draw the waveforms themselves. Unless record_history is False,
+    every window is also recorded and indexed, so that earlier windows can be
+    queried by time range, and their signals fetched decimated. Windows are
+    recorded by a writer thread of the server, so that the Stream handing them over
+    never waits for the disk.
+    """
 
-    def __init__(self, host: str, port: int, num_files: int = 1) -> None:
+    IMMUTABLE = "public, max-age=31536000, immutable"   # For URLs naming the version of their content
+    EXPOSED_HEADERS = [                                 # Readable by portals served from another origin
+        "ETag", "X-Window", "X-Channels", "X-Samples", "X-Decimation", "X-Sample-Rate",
+        "X-Channel-Names", "X-Begin-Timestamp"]
+
+    def __init__(
+            self, 
+            host: str, 
+            port: int, 
+            cache_bytes: int = 64 * 1024 * 1024, 
+            signal_history: int = 16, 
+            record_history: bool = True,
+            max_raw_samples: int = 1_000_000,
+            ) -> None:
         self.host = host
         self.port = port
         self.app = FastAPI()
         self.setup_cors()
-        self.subfolders = []
+        self.sessions: dict[str, dict] = dict()        # Name -> output destination and processed subfolders
         self.output_destination = None
+        self.cache = ArtifactCache(max_bytes=cache_bytes)
+        self.broadcaster = EventBroadcaster()
+        self.telemetry = Telemetry()                    # Metrics of every session, served at /metrics
+        self.telemetry.add_collector(self.collect_metrics)
+        self.signal_history = signal_history            # Number of raw windows kept per session
+        self.record_history = record_history            # Whether every window is recorded and indexed
+        self.max_raw_samples = max_raw_samples          # Samples per channel read at most by /history
+        self.recordings = queue.Queue()                 # Windows waiting for the writer thread
+        self.recorder = threading.Thread(target=self._record, daemon=True)
+        self.recorder.start()
         self.define_routes()
-        self.observer = None
-        self.last_processed_subfolder = None
-        self.num_files = num_files
 
     def setup_cors(self):
         self.app.add_middleware(
@@ -63,8 +69,18 @@ class Server:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=Server.EXPOSED_HEADERS,
         )
 
+    def get_session(self, name: str|None = None) -> dict:
+        if name is None:
+            if not self.sessions:
+                raise HTTPException(status_code=404, detail="No session is registered.")
+            return next(iter(self.sessions.values()))
+        if name not in self.sessions:
+            raise HTTPException(status_code=404, detail=f"Session {name} does not exist.")
+        return self.sessions[name]
+
     def define_routes(self):
 
         @self.app.get("/status")
@@ -76,50 +92,443 @@ class Server:
         
         @self.app.get("/latest")
         async def get_latest():
-            if not self.subfolders:
+            if not self.sessions:
                 return {"empty": True}
-            
-            latest_folder_name = self.subfolders[-1]
-            if latest_folder_name == self.last_processed_subfolder:
-                return {"empty": True}
-            self.last_processed_subfolder = latest_folder_name
-            
-            latest_folder_path = os.path.join(self.output_destination, latest_folder_name)
-            
-            png_files = [f for f in os.listdir(latest_folder_path) if f.endswith('.png')]
-            images_base64 = {}
-            for png_file in png_files:
-                png_path = os.path.join(latest_folder_path, png_file)
-                with open(png_path, "rb") as image_file:
-                    encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-                    images_base64[png_file] = encoded_string
-                    
-            return {"images": images_base64}
-
-    def inject_output_destination_name(self, output_destination):
-        self.output_destination = output_destination
-        if not os.path.exists(self.output_destination):
-            os.makedirs(self.output_destination)
-        self.start_monitoring()
-
-    def start_monitoring(self):
-        event_handler = NewFolderHandler(self)
-        self.observer = Observer()
-        self.observer.schedule(event_handler, self.output_destination, recursive=False)
-        self.observer.start()
-
-    def add_subfolder(self, folder_name):
-        self.subfolders.append(folder_name)
+            return self.read_latest(self.get_session())
+
+        @self.app.get("/sessions")
+        async def get_sessions():
+            return {"sessions": list(self.sessions)}
+
+        @self.app.get("/sessions/{name}/status")
+        async def get_session_status(name: str):
+            return {
+                "status": "ready",
+                "output_destination": self.get_session(name)["output_destination"],
+            }
+
+        @self.app.get("/sessions/{name}/latest")
+        async def get_session_latest(name: str):
+            return self.read_latest(self.get_session(name))
+
+        @self.app.get("/latest/{artifact}")
+        async def get_latest_artifact(artifact: str, request: Request):
+            return self.serve_latest_artifact(None, artifact, request)
+
+        @self.app.get("/sessions/{name}/latest/{artifact}")
+        async def get_session_latest_artifact(name: str, artifact: str, request: Request):
+            return self.serve_latest_artifact(name, artifact, request)
+
+        @self.app.get("/artifacts/{window}/{artifact}")
+        async def get_artifact(window: str, artifact: str, request: Request):
+            return self.serve_artifact(None, window, artifact, request)
+
+        @self.app.get("/sessions/{name}/artifacts/{window}/{artifact}")
+        async def get_session_artifact(name: str, window: str, artifact: str, request: Request):
+            return self.serve_artifact(name, window, artifact, request)
+
+        @self.app.get("/signal/{window}")
+        async def get_signal(window: str, request: Request, width: int|None = None):
+            return self.serve_signal(None, window, width, request)
+
+        @self.app.get("/sessions/{name}/signal/{window}")
+        async def get_session_signal(name: str, window: str, request: Request, width: int|None = None):
+            return self.serve_signal(name, window, width, request)
+
+        @self.app.get("/windows")
+        async def get_windows(start: float|None = None, end: float|None = None, after: int|None = None, limit: int = 100):
+            return self.query_windows(None, start, end, after, limit)
+
+        @self.app.get("/sessions/{name}/windows")
+        async def get_session_windows(
+                name: str, start: float|None = None, end: float|None = None, after: int|None = None, limit: int = 100):
+            return self.query_windows(name, start, end, after, limit)
+
+        @self.app.get("/history")
+        async def get_history(start: float|None = None, end: float|None = None, points: int = 1000, method: str = "minmax"):
+            return self.read_history(None, start, end, points, method)
+
+        @self.app.get("/sessions/{name}/history")
+        async def get_session_history(
+                name: str, start: float|None = None, end: float|None = None, points: int = 1000, method: str = "minmax"):
+            return self.read_history(name, start, end, points, method)
+
+        @self.app.get("/events")
+        async def get_events(request: Request, names: str|None = None, cursor: int|None = None):
+            return self.stream_events(request, None, names, cursor)
+
+        @self.app.get("/sessions/{name}/events")
+        async def get_session_events(name: str, request: Request, names: str|None = None, cursor: int|None = None):
+            self.get_session(name)
+            return self.stream_events(request, name, names, cursor)
+
+        @self.app.get("/metrics")
+        async def get_metrics():
+            return Response(content=self.telemetry.render(), media_type="text/plain; version=0.0.4")
+
+    def stream_events(self, request: Request, session_name: str|None, names: str|None, cursor: int|None):
+        """
+        Push every completed window to the client as a Server-Sent Event, with the
+        URLs and ETags of its artifacts, only of those in the comma-separated names
+        if given. The client resumes from its cursor, either the query parameter or
+        the Last-Event-ID header its EventSource sends when reconnecting.
+        """
+        if cursor is None and request.headers.get("last-event-id", "").isdigit():
+            cursor = int(request.headers["last-event-id"])
+        wanted = set(names.split(",")) if names else None
+
+        async def events():
+            yield "retry: 1000\n\n"
+            async for item in self.broadcaster.subscribe(cursor):
+                if await request.is_disconnected():
+                    break
+                if item is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event_id, event = item
+                if session_name is not None and event["session"] != session_name:
+                    continue
+                artifacts = {name: artifact for name, artifact in event["artifacts"].items() 
+                             if wanted is None or name in wanted}
+                if wanted is not None and not artifacts:
+                    continue
+                data = json.dumps(dict(event, artifacts=artifacts))
+                yield f"id: {event_id}\nevent: {event.get('type', 'window')}\ndata: {data}\n\n"
+                if event.get("type", "window") == "window":
+                    self.mark_delivered(event["session"], event["window"])
+
+        return StreamingResponse(
+            events(), 
+            media_type="text/event-stream", 
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    def publish_window(self, session_name: str, window: str) -> None:
+        session = self.sessions[session_name]
+        artifacts = {}
+        for name in session["windows"][window]:
+            artifact = self.cache.get(session_name, window, name)
+            artifacts[name] = {
+                "url": f"/sessions/{session_name}/artifacts/{window}/{name}"
+                       + (f"?v={artifact.version}" if artifact is not None else ""),
+                "etag": artifact.etag if artifact is not None else None,
+            }
+        self.broadcaster.publish({"session": session_name, "window": window, "artifacts": artifacts})
+
+    def publish_signal(
+            self, 
+            session_name: str, 
+            window: str, 
+            data: np.ndarray, 
+            sample_rate: float, 
+            channels: list[str], 
+            begin_timestamp: float|None = None,
+            ) -> None:
+        """
+        Called by a Frame as soon as a window of signals is complete, before any
+        pipeline runs on it. The window is kept as float32, and a "signal" event is
+        pushed to the clients subscribed to the name "signal".
+        """
+        session = self.sessions[session_name]
+        data = np.array(data, dtype="<f4")                          # Copied, since the ring buffer moves on
+        if self.record_history:
+            self.record_window(session, int(window), data, sample_rate, channels, begin_timestamp)
+        version = hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+        session["signals"][window] = {
+            "data": data,
+            "version": version,                                         # Serials repeat across runs, contents do not
+            "sample_rate": sample_rate,
+            "channels": list(channels),
+            "begin_timestamp": begin_timestamp,
+        }
+        while len(session["signals"]) > self.signal_history:
+            session["signals"].popitem(last=False)
+        self.broadcaster.publish({
+            "type": "signal",
+            "session": session_name, 
+            "window": window, 
+            "artifacts": {"signal": {"url": f"/sessions/{session_name}/signal/{window}?v={version}"}},
+        })
+
+    def record_window(self, session, serial, data, sample_rate, channels, begin_timestamp):
+        """
+        Queue a window to be recorded and indexed by the writer thread.
+        """
+        self.recordings.put((session, serial, data, sample_rate, channels, begin_timestamp))
+
+    def _record(self) -> None:
+        while True:
+            recording = self.recordings.get()
+            if recording is None:
+                return
+            try:
+                self._write_window(*recording)
+            except Exception:
+                traceback.print_exc()
+
+    def _write_window(self, session, serial, data, sample_rate, channels, begin_timestamp):
+        if session["store"] is None:
+            session["store"] = SessionStore.open(
+                os.path.join(session["output_destination"], "history"), 
+                channels=list(channels), 
+                sample_rate=sample_rate, 
+                window_size=data.shape[1])
+        session["store"].append(serial, begin_timestamp, data)
+        session["index"].add_window(serial, begin_timestamp, data)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Record the windows still queued, and stop the writer thread.
+        """
+        if self.recorder.is_alive():
+            self.recordings.put(None)
+            self.recorder.join(timeout)
+
+    def query_windows(self, session_name, start, end, after, limit):
+        """
+        Page through the indexed windows beginning in [start, end), in seconds since
+        the epoch. "next" is the value of after that gives the next page, if any.
+        """
+        session = self.get_session(session_name)
+        windows = session["index"].query(start=start, end=end, after=after, limit=max(1, min(limit, 1000)))
+        return {
+            "windows": windows,
+            "next": windows[-1]["serial"] if len(windows) == max(1, min(limit, 1000)) else None,
+        }
+
+    def read_history(self, session_name, start, end, points, method):
+        """
+        Get the signals of the windows beginning in [start, end), in seconds since
+        the epoch, decimated to about points values per channel, either with min/max
+        buckets or with LTTB. Min/max buckets spanning whole windows are taken from
+        the statistics in the index, without reading any signals, so that overviews
+        of long time ranges stay fast. Ranges of more than max_raw_samples samples
+        are never read either: they are decimated from the minimum and maximum of
+        every window in the index, and LTTB then runs on those. Times are in seconds
+        since the first sample of the session.
+        """
+        if method not in ("minmax", "lttb"):
+            raise HTTPException(status_code=400, detail="The method must be minmax or lttb.")
+        if points < 3:
+            raise HTTPException(status_code=400, detail="At least 3 points must be requested.")
+        session = self.get_session(session_name)
+        store = session["store"]
+        serials, minimum, maximum = session["index"].summaries(start, end)
+        if store is None or len(serials) == 0:
+            return {"channels": [], "method": method, "source": None, "windows": 0, "series": []}
+        window_size = store.window_size
+
+        if (method == "minmax" and points // 2 <= len(serials)) or len(serials) * window_size > self.max_raw_samples:
+            # Each bucket spans whole windows, whose minima and maxima are indexed
+            num_buckets = min(points // 2, len(serials)) if method == "minmax" else len(serials)
+            starts = Decimation.bucket_edges(len(serials), num_buckets)[:-1]
+            values = np.stack([
+                np.minimum.reduceat(minimum, starts, axis=0).T,
+                np.maximum.reduceat(maximum, starts, axis=0).T], axis=-1).reshape(minimum.shape[1], -1)
+            times = np.repeat(serials[starts] - window_size + 1, 2)
+            times = np.tile(times, (values.shape[0], 1))
+            if method == "lttb":
+                indices = Decimation.lttb(values, points)
+                values = np.take_along_axis(values, indices, axis=1)
+                times = np.take_along_axis(times, indices, axis=1)
+            source = "index"
+        else:
+            windows = [(serial, store.read_window(serial // window_size)) for serial in serials]
+            windows = [(serial, window) for serial, window in windows if window is not None]
+            if len(windows) == 0:                       # Indexed, but not recorded yet
+                return {"channels": [], "method": method, "source": None, "windows": 0, "series": []}
+            data = np.concatenate([window for _, window in windows], axis=1)
+            sample_serials = np.concatenate([np.arange(serial - window_size + 1, serial + 1) for serial, _ in windows])
+            if method == "minmax":
+                values = Decimation.min_max(data, points // 2)
+                if values is data:
+                    times = sample_serials
+                else:
+                    times = np.repeat(sample_serials[Decimation.bucket_edges(data.shape[1], points // 2)[:-1]], 2)
+                times = np.tile(times, (values.shape[0], 1))
+            else:
+                indices = Decimation.lttb(data, points)
+                values = np.take_along_axis(data, indices, axis=1)
+                times = sample_serials[indices]
+            source = "raw"
+
+        return {
+            "channels": store.channels,
+            "sample_rate": store.sample_rate,
+            "method": method,
+            "source": source,
+            "windows": int(len(serials)),
+            "series": [
+                {"channel": channel, "t": (time_row / store.sample_rate).tolist(), "v": value_row.tolist()}
+                for channel, time_row, value_row in zip(store.channels, times, values)],
+        }
+
+    def serve_signal(self, session_name, window, width, request):
+        """
+        Serve the raw signals of a window, or of the latest one, as little-endian
+        float32 in (channels x samples) order. If a width is given, each channel is
+        min/max decimated to at most 2 * width values. The shape and the channel
+        names are given in the X-Channels, X-Samples and X-Channel-Names headers. As
+        for artifacts, only a URL with the version of the signals, ?v=<version>, is
+        cached for good, and the ETag is made from the version.
+        """
+        session = self.get_session(session_name)
+        signals = session["signals"]
+        if window == "latest":
+            if not signals:
+                raise HTTPException(status_code=404, detail="No window is complete yet.")
+            window = next(reversed(signals))
+        signal = signals.get(window)
+        if signal is None:
+            raise HTTPException(status_code=404, detail=f"The signals of window {window} are not available.")
+        
+        etag = f'"{signal["version"]}-{width}"'
+        immutable = request.path_params["window"] != "latest" and request.query_params.get("v") == signal["version"]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": Server.IMMUTABLE if immutable else "no-cache",
+            "X-Window": window,
+        }
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        data = signal["data"] if width is None else Decimation.min_max(signal["data"], max(1, width))
+        headers.update({
+            "X-Channels": str(data.shape[0]),
+            "X-Samples": str(data.shape[1]),
+            "X-Decimation": "none" if data is signal["data"] else "minmax",
+            "X-Sample-Rate": str(signal["sample_rate"]),
+            "X-Channel-Names": ",".join(signal["channels"]),
+            "X-Begin-Timestamp": str(signal["begin_timestamp"]),
+        })
+        return Response(content=data.tobytes(), media_type="application/octet-stream", headers=headers)
+
+    def read_latest(self, session: dict) -> dict:
+        if not session["subfolders"]:
+            return {"empty": True}
+        
+        latest_folder_name = session["subfolders"][-1]
+        if latest_folder_name == session["last_processed_subfolder"]:
+            return {"empty": True}
+        session["last_processed_subfolder"] = latest_folder_name
+        
+        images_base64 = {}
+        for png_file in session["windows"][latest_folder_name]:
+            artifact = self.get_artifact(session, latest_folder_name, png_file)
+            if artifact is not None:
+                images_base64[png_file] = artifact.base64()
+                
+        return {"images": images_base64}
+
+    def get_artifact(self, session: dict, window: str, name: str):
+        """
+        Get an artifact of a completed window from the cache, reading it again from
+        disk only if it was evicted.
+        """
+        if window not in session["windows"] or name not in session["windows"][window]:
+            return None
+        artifact = self.cache.get(session["name"], window, name)
+        if artifact is None:
+            path = os.path.join(session["output_destination"], window, name)
+            if not os.path.isfile(path):
+                return None
+            with open(path, "rb") as file:
+                artifact = Artifact(name, file.read())
+            self.cache.put(session["name"], window, artifact)
+        return artifact
+
+    def serve_artifact(self, session_name, window, name, request, cache_control=None):
+        """
+        Serve an artifact of a window. Window serials start again at 0 with every
+        run, so the same URL names different figures over time: only a URL with the
+        version of the artifact, ?v=<version>, as pushed in the events, is cached for
+        good, while others are revalidated against the ETag, a hash of the content.
+        """
+        artifact = self.get_artifact(self.get_session(session_name), window, name)
+        if artifact is None:
+            raise HTTPException(status_code=404, detail=f"Artifact {name} of window {window} does not exist.")
+        if cache_control is None:
+            cache_control = Server.IMMUTABLE if request.query_params.get("v") == artifact.version else "no-cache"
+        headers = {"ETag": artifact.etag, "Cache-Control": cache_control}
+        self.mark_delivered(self.get_session(session_name)["name"], window)
+        if artifact.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(content=artifact.content, media_type=artifact.media_type, headers=headers)
+
+    def mark_delivered(self, session_name: str, window: str) -> None:
+        """
+        Stamp the first delivery of a window to a client in the latency trace of its
+        Frame, and observe the time since its publication.
+        """
+        latency = self.sessions[session_name]["latency"]
+        if latency is None:
+            return
+        trace = latency.deliver(window, time.monotonic())
+        if trace is not None and trace.get("published") is not None:
+            self.telemetry.observe("latency_seconds", trace["delivered"] - trace["published"],
+                                   {"session": session_name, "segment": "delivering"},
+                                   "Latency of each segment of the path of a window, from acquisition to delivery.")
+
+    def serve_latest_artifact(self, session_name, name, request):
+        session = self.get_session(session_name)
+        if not session["subfolders"]:
+            raise HTTPException(status_code=404, detail="No window is complete yet.")
+        headers = {"X-Window": session["subfolders"][-1]}
+        response = self.serve_artifact(session_name, session["subfolders"][-1], name, request, "no-cache")
+        response.headers.update(headers)
+        return response
+
+    def inject_output_destination_name(self, output_destination, name="default", latency=None):
+        """
+        Register the output destination of a Frame as the session of the given name,
+        with the LatencyTracker of the Frame, if any, to mark delivered windows in.
+        """
+        if name in self.sessions:
+            raise ValueError(f"A session named {name} is already registered.")
+        if self.output_destination is None:
+            self.output_destination = output_destination
+        if not os.path.exists(output_destination):
+            os.makedirs(output_destination)
+        self.sessions[name] = {
+            "name": name,
+            "output_destination": output_destination,
+            "windows": dict(),                          # Window -> names of its artifacts
+            "signals": OrderedDict(),                   # Window -> raw signals of the latest windows
+            "index": WindowIndex(os.path.join(output_destination, "windows.sqlite")),
+            "store": None,                              # SessionStore of every window, once the first is recorded
+            "subfolders": [],
+            "last_processed_subfolder": None,
+            "latency": latency,                         # LatencyTracker of the Frame
+        }
+
+    def notify_window_complete(self, session_name: str, window: str, artifacts: list[str]) -> None:
+        """
+        Called once a window of a session is complete, with the names of the artifacts
+        written into its folder. They are read into the cache and pushed to the
+        subscribed clients right away, so the folder is never polled.
+        """
+        session = self.sessions[session_name]
+        folder_path = os.path.join(session["output_destination"], window)
+        session["windows"][window] = self.cache.load_window(session_name, window, folder_path, artifacts)
+        if self.record_history:
+            session["index"].set_artifacts(int(window), artifacts)
+        session["subfolders"].append(window)
+        self.publish_window(session_name, window)
+
+    def collect_metrics(self) -> list[tuple]:
+        """
+        Get the size of the artifact cache, the number of events published and the
+        windows waiting to be recorded as telemetry metrics.
+        """
+        return [
+            ("artifact_cache_bytes", "gauge", "Bytes of artifacts held in memory.", None, self.cache.size),
+            ("artifact_cache_entries", "gauge", "Artifacts held in memory.", None, len(self.cache.entries)),
+            ("events_published_total", "counter", "Events pushed to the subscribed clients.", None,
+             self.broadcaster.next_id - 1),
+            ("windows_recording", "gauge", "Windows waiting for the writer thread to be recorded.", None,
+             self.recordings.qsize()),
+        ]
 
     def run(self):
         try:
             uvicorn.run(self.app, host=self.host, port=self.port)
-        except KeyboardInterrupt:
-            if self.observer:
-                self.observer.stop()
-                self.observer.join()
-
-    def __del__(self):
-        if hasattr(self, 'observer') and self.observer:
-            self.observer.stop()
-            self.observer.join()
\ No newline at end of file
+        finally:
+            self.close()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os, threading, traceback
+from model.Frame import Frame
+from model.Server import Server
+from model.Stream import Stream
+from model.WorkerPool import WorkerPool
+
+
+class SessionManager:
+    """
+    The SessionManager class runs several sessions, each of them a Stream feeding a
+    Frame, such as one per headset, in a single process tree. All Frames share one
+    pool of worker processes and one Server, whose routes are namespaced per session
+    under /sessions/{name}. The pool hands windows to the workers in turn across
+    sessions, and each session queues at most max_queued_windows windows, so that a
+    busy session cannot starve the others, and adding a session adds neither worker
+    processes nor ports.
+    """
+
+    def __init__(
+            self,
+            output_directory: str,
+            server: Server|None = None,
+            num_workers: int = 2,
+            max_queued_windows: int = 4,
+            overflow_policy: str = "drop_oldest",
+            ) -> None:
+
+        self.output_directory = output_directory
+        self.server = server
+        self.pool = WorkerPool(
+            num_workers=num_workers,
+            max_queued=max_queued_windows,
+            overflow_policy=overflow_policy)
+        self.sessions: dict[str, dict] = dict()         # Name -> stream, frame and reading thread
+        self.started = False
+
+    def add_session(
+            self,
+            name: str,
+            stream: Stream,
+            pipeline: list[callable],
+            **frame_kwargs,
+            ) -> Frame:
+        """
+        Add a session reading from the given stream. A Frame is created on the shared
+        pool and server with the given keyword arguments, such as channels and
+        sample_rate, writing its results under output_directory/name, and wrapped
+        with the pipeline. Sessions must be added before the manager starts.
+        """
+        if self.started:
+            raise RuntimeError("Sessions must be added before the manager starts.")
+        if name in self.sessions:
+            raise ValueError(f"A session named {name} already exists.")
+
+        frame = Frame(
+            output_directory=os.path.join(self.output_directory, name),
+            server=self.server,
+            name=name,
+            pool=self.pool,
+            **frame_kwargs)
+        frame.wrap(pipeline=pipeline)
+        stream.onload(pipeline=[frame.add_block], blocks=True)         # Also registers the metrics of the stream
+        self.sessions[name] = {"stream": stream, "frame": frame, "thread": None, "error": None}
+        return frame
+
+    def start(self) -> None:
+        """
+        Start the shared worker processes, and then every stream, each read in a
+        thread of its own, so that they all run at once. A stream that stops on an
+        error is reported, and its error kept for SessionManager.get_errors, while
+        the other sessions keep running.
+        """
+        if self.started:
+            return
+        self.pool.start()
+        for name, session in self.sessions.items():
+            thread = threading.Thread(target=self._run_stream, args=(name, session), daemon=True)
+            thread.start()
+            session["thread"] = thread
+        self.started = True
+
+    def _run_stream(self, name: str, session: dict) -> None:
+        try:
+            session["stream"].run()
+        except Exception as error:
+            session["error"] = error
+            print(f"The stream of session {name} stopped on an error:")
+            traceback.print_exc()
+
+    def run(self) -> None:
+        """
+        Start every session, and run the server until it is interrupted.
+        """
+        self.start()
+        if self.server is None:
+            raise ValueError("No server was given to the SessionManager.")
+        try:
+            self.server.run()
+        finally:
+            self.close()
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Get the window counters of every session, as Frame.get_stats.
+        """
+        return {name: session["frame"].get_stats() for name, session in self.sessions.items()}
+
+    def get_errors(self) -> dict[str, Exception]:
+        """
+        Get the error that stopped the stream of every session that failed.
+        """
+        return {name: session["error"] for name, session in self.sessions.items() if session["error"] is not None}
+
+    def get_latency(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Get the latency breakdown of every session, as Frame.get_latency.
+        """
+        return {name: session["frame"].get_latency() for name, session in self.sessions.items()}
+
+    def close(self) -> None:
+        """
+        Stop every BrainFlow stream and the shared worker processes, and free the
+        shared memory of every Frame.
+        """
+        for session in self.sessions.values():
+            session["stream"].stop()
+        self.pool.stop()
+        for session in self.sessions.values():
+            session["frame"].close()
+        self.started = False
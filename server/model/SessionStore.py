@@ -0,0 +1,124 @@
+import numpy as np
+import os, json
+
+
+class SessionStore:
+    """
+    The SessionStore class records every window of a session into one append-only
+    binary file of float32 values, alongside a small fixed-size index of the window
+    serials, begin times and offsets. Since every window has the same size, window k
+    (the window whose last sample has the serial (k + 1) * window_size - 1) always
+    lives at the same offset, so that several worker processes can append windows
+    concurrently, in any order, without locking. Reads are memory-mapped, and any
+    window can be accessed at random.
+    """
+
+    INDEX_DTYPE = np.dtype([
+        ("serial", "<i8"),                              # Serial of the last sample of the window
+        ("begin_time", "<f8"),                          # Begin time of the window, in seconds since the epoch
+        ("offset", "<i8"),                              # Byte offset of the window in the data file
+        ("valid", "<i8"),                               # 1 once the window has been written
+    ])
+    DATA_DTYPE = np.dtype("<f4")
+
+    stores: dict[str, "SessionStore"] = dict()          # Directory -> open store, per process
+
+    def __init__(self, directory: str, channels: list[str]|None = None,
+                 sample_rate: float|None = None, window_size: int|None = None) -> None:
+        self.directory = directory
+        self.header_path = os.path.join(directory, "header.json")
+        self.data_path = os.path.join(directory, "data.f32")
+        self.index_path = os.path.join(directory, "index.bin")
+
+        if os.path.exists(self.header_path):
+            with open(self.header_path, "r") as file:
+                header = json.load(file)
+        elif channels is not None and sample_rate is not None and window_size is not None:
+            header = {"channels": list(channels), "sample_rate": sample_rate, "window_size": window_size}
+            os.makedirs(directory, exist_ok=True)
+            temporary_path = f"{self.header_path}.{os.getpid()}"
+            with open(temporary_path, "w") as file:
+                json.dump(header, file)
+            os.replace(temporary_path, self.header_path)
+        else:
+            raise ValueError(f"No session is recorded in {directory}.")
+
+        self.channels = header["channels"]
+        self.sample_rate = header["sample_rate"]
+        self.window_size = header["window_size"]
+        self.window_bytes = len(self.channels) * self.window_size * SessionStore.DATA_DTYPE.itemsize
+        self.data_file = None
+        self.index_file = None
+
+    @staticmethod
+    def open(directory: str, channels: list[str], sample_rate: float, window_size: int) -> "SessionStore":
+        """
+        Get the store of a directory for writing, creating it if needed. Stores are
+        opened once per process and then reused.
+        """
+        if directory not in SessionStore.stores:
+            SessionStore.stores[directory] = SessionStore(directory, channels, sample_rate, window_size)
+        return SessionStore.stores[directory]
+
+    def _open_for_writing(self) -> None:
+        for path in (self.data_path, self.index_path):
+            if not os.path.exists(path):
+                open(path, "ab").close()
+        self.data_file = open(self.data_path, "r+b")
+        self.index_file = open(self.index_path, "r+b")
+
+    def append(self, signal_serial: int, begin_time: float|None, data: np.ndarray) -> int:
+        """
+        Write a (channels x window_size) window, and return its window number.
+        """
+        if data.shape != (len(self.channels), self.window_size):
+            raise ValueError(f"The window must be of shape {(len(self.channels), self.window_size)}.")
+        if self.data_file is None:
+            self._open_for_writing()
+
+        window_number = signal_serial // self.window_size
+        offset = window_number * self.window_bytes
+        self.data_file.seek(offset)
+        self.data_file.write(np.ascontiguousarray(data, dtype=SessionStore.DATA_DTYPE).tobytes())
+        self.data_file.flush()
+
+        record = np.array(
+            [(signal_serial, np.nan if begin_time is None else begin_time, offset, 1)],
+            dtype=SessionStore.INDEX_DTYPE)
+        self.index_file.seek(window_number * SessionStore.INDEX_DTYPE.itemsize)
+        self.index_file.write(record.tobytes())     # Written after the data, so valid implies complete
+        self.index_file.flush()
+        return window_number
+
+    def index(self) -> np.ndarray:
+        """
+        Get the index records of every window slot, including those of windows that
+        were dropped or are not written yet, whose "valid" field is 0.
+        """
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0:
+            return np.zeros(0, dtype=SessionStore.INDEX_DTYPE)
+        return np.fromfile(self.index_path, dtype=SessionStore.INDEX_DTYPE)
+
+    def read_window(self, window_number: int) -> np.ndarray|None:
+        """
+        Get a read-only (channels x window_size) memory-mapped view of a window, or
+        None if that window was never written.
+        """
+        record_offset = window_number * SessionStore.INDEX_DTYPE.itemsize
+        if (window_number < 0 or not os.path.exists(self.index_path)
+                or os.path.getsize(self.index_path) < record_offset + SessionStore.INDEX_DTYPE.itemsize):
+            return None
+        record = np.fromfile(self.index_path, dtype=SessionStore.INDEX_DTYPE, count=1, offset=record_offset)[0]
+        if not record["valid"]:
+            return None
+        return np.memmap(
+            self.data_path, dtype=SessionStore.DATA_DTYPE, mode="r",
+            offset=int(record["offset"]),
+            shape=(len(self.channels), self.window_size))
+
+    def close(self) -> None:
+        for file in (self.data_file, self.index_file):
+            if file is not None:
+                file.close()
+        self.data_file = None
+        self.index_file = None
@@ -0,0 +1,79 @@
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+
+
+class SharedWindowBuffer:
+    """
+    The SharedWindowBuffer class is a fixed set of window-sized slots in a single
+    shared memory block, through which Frame hands windows to the worker processes.
+    A window is written into a free slot once, and only the slot index crosses the
+    process boundary; workers read the slot as a NumPy view and release it when they
+    are done. When pickled, only the name of the shared memory block is sent, and the
+    block is attached again on the other side.
+    """
+
+    def __init__(self, num_slots: int, num_channels: int, num_samples: int, dtype: str = "float64") -> None:
+        self.num_slots = num_slots
+        self.shape = (num_slots, num_channels, num_samples)
+        self.dtype = np.dtype(dtype)
+        self.memory = shared_memory.SharedMemory(
+            create=True,
+            size=int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.in_use = multiprocessing.Array("b", num_slots)     # 1 if the slot holds a pending window
+        self.owner = True
+        self._attach_array()
+
+    def _attach_array(self) -> None:
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["memory"] = self.memory.name
+        state["owner"] = False
+        del state["array"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.memory = shared_memory.SharedMemory(name=state["memory"])
+        self._attach_array()
+
+    def acquire(self) -> int|None:
+        """
+        Reserve a free slot and return its index, or None if every slot is in use.
+        """
+        with self.in_use.get_lock():
+            for slot in range(self.num_slots):
+                if not self.in_use[slot]:
+                    self.in_use[slot] = 1
+                    return slot
+        return None
+
+    def write(self, slot: int, data: np.ndarray) -> None:
+        self.array[slot] = data
+
+    def view(self, slot: int) -> np.ndarray:
+        """
+        Get the (channels x samples) window held in a slot, without copying it. The
+        view must not be used after the slot is released.
+        """
+        return self.array[slot]
+
+    def release(self, slot: int) -> None:
+        with self.in_use.get_lock():
+            self.in_use[slot] = 0
+
+    def num_used(self) -> int:
+        with self.in_use.get_lock():
+            return sum(self.in_use[:])
+
+    def close(self) -> None:
+        """
+        Detach from the shared memory block, and free it if this is the instance
+        that created it.
+        """
+        del self.array
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -1,6 +1,11 @@
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds, BrainFlowError
-import serial, threading, time
+from brainflow.board_shim import BoardShim
+import inspect, serial, threading, time
 import numpy as np
+import pandas as pd
+import pyedflib
+from model.BoardAcquisition import BoardAcquisition
+from model.ReplayClock import ReplayClock
+from model.SerialParser import SerialParser
 
 
 class Stream:
@@ -15,7 +20,16 @@ class Stream:
             drop_last: int = 0,
             drop_first: int = 0,
             drop_header_rows: int = 0,
-            board_type: str|None = None,
+            board_type: str|int|None = None,
+            chunk_size: int = 4096,
+            sample_rate: float|None = None,
+            speed: float|None = 1.0,
+            serial_framing: str = "text",
+            sequence_modulo: int = 100,
+            binary_scale: float = 1.0,
+            board_chunk_size: int|None = None,
+            board_buffer_size: int = 45000,
+            board_name: str|None = None,
             ) -> None:
         
         self.serial_port = serial_port
@@ -25,155 +39,310 @@ class Stream:
         self.drop_first = drop_first
         self.drop_header_rows = drop_header_rows
         self.board_type = board_type
+        self.chunk_size = chunk_size
+        self.edf = None
+        self.acquisition = None
+        self.sample_rate = sample_rate                      # Read from the header for EDF files
+        self.speed = speed
+        self.channel_labels = None
+        self.clock = None
+        self.parser = SerialParser(
+            framing=serial_framing, 
+            sequence_modulo=sequence_modulo, 
+            binary_scale=binary_scale)
+        self.pipeline = []
+        self.blocks = False
+        self.timed = []                                     # Whether each processor takes the acquisition time
+        self.samples = 0                                    # Samples passed down the pipeline
+        self.telemetry_sessions = set()                     # (server, session) the metrics are registered with
         
-        if (file_name is not None and serial_port is not None) or (file_name is None and serial_port is None):
+        if board_type is not None and file_name is not None:
+            raise ValueError("A board_type cannot be combined with a file_name.")
+        if board_type is None and (file_name is not None) == (serial_port is not None):
             raise ValueError("Exactly one of file_name or serial_port must be provided.")
         
-        if serial_port is not None:
-            if board_type is None:
-                try:
-                    self.serial = serial.Serial(self.serial_port, self.baud_rate)
-                except Exception:
-                    raise ValueError(f"Failed to connect to serial port {self.serial_port}. See README for trouble-shooting Exiting...")
-            elif board_type == "Cyton":
-                # Setup board parameters
-                BoardShim.enable_dev_board_logger()
-                self.board_params = BrainFlowInputParams()
-                self.board_params.serial_port = self.serial_port  # Adjust this to your Cyton's serial port
-                self.board_id = BoardIds.CYTON_BOARD.value
-
-                # Initialize board
-                self.board = BoardShim(self.board_id, self.board_params)
-                self.board.prepare_session()
+        if board_type is not None:
+            # Any BrainFlow board, such as "Cyton", or "Synthetic" which needs no serial port
+            BoardShim.enable_dev_board_logger()
+            self.acquisition = BoardAcquisition(
+                board_type=board_type,
+                serial_port=serial_port,
+                poll_interval=read_pause,
+                chunk_size=board_chunk_size,
+                buffer_size=board_buffer_size,
+                name=board_name)
+            self.board = self.acquisition.board
+            self.board_id = self.acquisition.board_id
+            self.sample_rate = self.acquisition.sample_rate
+            self.channel_labels = self.acquisition.channel_labels
+            self.acquisition.prepare()                      # Streaming starts with Stream.start
+
+        elif serial_port is not None:
+            try:
+                self.serial = serial.Serial(self.serial_port, self.baud_rate)
+            except Exception:
+                raise ValueError(f"Failed to connect to serial port {self.serial_port}. See README for trouble-shooting Exiting...")
 
         else:
             self.file_name = file_name
-            self.file = open(self.file_name, "r")
+            if self.file_name.lower().endswith(".edf"):
+                self.open_edf()
+            else:
+                self.file = open(self.file_name, "r")
+
+    def open_edf(self):
+        """
+        Open an EDF file to be streamed directly. The sample rate and the channel 
+        labels are read from its header, after drop_first and drop_last are applied 
+        to its signals; all remaining signals must share the same sample rate.
+        """
+        self.edf = pyedflib.EdfReader(self.file_name)
+        signal_count = self.edf.signals_in_file
+        self.edf_signals = list(range(signal_count))[self.drop_first:signal_count - self.drop_last]
+        if len(self.edf_signals) == 0:
+            raise ValueError("No signals are left after dropping the first and last signals.")
+
+        sample_rates = {self.edf.getSampleFrequency(i) for i in self.edf_signals}
+        if len(sample_rates) != 1:
+            raise ValueError(f"All streamed EDF signals must share one sample rate, but found {sorted(sample_rates)}.")
+        labels = self.edf.getSignalLabels()
+        self.sample_rate = sample_rates.pop()
+        self.channel_labels = [labels[i] for i in self.edf_signals]
 
 
     def start(self):
         """
-        Start a new thread to read the serial port.
+        Start a new thread to read the serial port or the board, or read the file.
         """
-        if self.serial_port is not None:
-            stream_method = None
-            if self.board_type is None:
-                stream_method = self.stream_general_serial
-            elif self.board_type == "Cyton":
-                stream_method = self.stream_cyton
-
-            thread = threading.Thread(target=stream_method)
+        if self.acquisition is not None or self.serial_port is not None:
+            thread = threading.Thread(target=self.run)
             thread.daemon = True
             thread.start()
+        else:
+            self.run()
+
+    def run(self):
+        """
+        Read the board, the serial port or the file in the calling thread, until the
+        file ends or the stream is stopped. Errors are raised to the caller.
+        """
+        if self.acquisition is not None:
+            self.stream_board()
+        elif self.serial_port is not None:
+            self.stream_general_serial()
+        elif self.edf is not None:
+            self.read_edf()
         else:
             self.read()
     
 
     def read(self):
         """
-        Read the file as if it were a stream, one signal at a time.
+        Read the file as if it were a stream. The file is parsed in chunks of
+        chunk_size rows at once, and the dropped rows and columns are sliced off 
+        each chunk. Depending on Stream.onload, the pipeline receives either one
+        signal at a time, or a whole chunk as a single block.
         """
-        i = 0
-        for line in self.file:
-            if i < self.drop_header_rows:
-                continue
-            signals = ",".join(line.split(",")[self.drop_first:-self.drop_last])
-            for processor in self.pipeline:
-                if type(processor) is tuple:
-                    processor[0](signals, **processor[1])
-                else:
-                    processor(signals)
-            time.sleep(self.read_pause)
-            i += 1
+        reader = pd.read_csv(
+            self.file, 
+            header=None, 
+            skiprows=self.drop_header_rows, 
+            chunksize=self.chunk_size)
+        for chunk in reader:
+            last_column = chunk.shape[1] - self.drop_last
+            block = chunk.iloc[:, self.drop_first:last_column].to_numpy(dtype=float).T
+            self.replay(block)
 
         
+    def get_replay_clock(self) -> ReplayClock:
+        """
+        Get the clock pacing the replay of a file. The file is replayed at its sample
+        rate times the speed, where the sample rate is the one given, the one of the
+        EDF header, or else one sample per read_pause. A read_pause of 0 or a speed of 
+        None replays the file as fast as possible.
+        """
+        sample_rate = self.sample_rate
+        if sample_rate is None and self.read_pause > 0:
+            sample_rate = 1 / self.read_pause
+        speed = self.speed if self.read_pause > 0 else None
+        return ReplayClock(sample_rate=sample_rate, speed=speed)
+
+    def replay(self, block: np.ndarray) -> None:
+        """
+        Pass a chunk of a file down the pipeline in batches paced by the replay clock.
+        """
+        if self.clock is None:
+            self.clock = self.get_replay_clock()
+            self.clock.start()
+        batch_size = self.clock.batch_size(default=block.shape[1])
+        for start in range(0, block.shape[1], batch_size):
+            batch = block[:, start:start + batch_size]
+            self.emit_block(batch)
+            self.clock.wait(batch.shape[1])
+
+    def replay_stats(self) -> dict[str, float]:
+        """
+        Get the number of samples replayed, the achieved sample rate, and the lag in
+        seconds behind the replay schedule.
+        """
+        if self.clock is None:
+            return ReplayClock(sample_rate=None).stats()
+        return self.clock.stats()
+
+    def read_edf(self):
+        """
+        Read an EDF file as if it were a stream, without converting it to a CSV first.
+        Whole data records are read at once, in chunks of at least chunk_size samples, 
+        and passed down the pipeline like the chunks of Stream.read.
+        """
+        num_samples = int(self.edf.getNSamples()[self.edf_signals[0]])
+        samples_per_record = max(1, int(round(self.sample_rate * self.edf.datarecord_duration)))
+        chunk_samples = samples_per_record * max(1, -(-self.chunk_size // samples_per_record))
+        for start in range(0, num_samples, chunk_samples):
+            count = min(chunk_samples, num_samples - start)
+            block = np.empty((len(self.edf_signals), count))
+            for row, signal in enumerate(self.edf_signals):
+                block[row] = self.edf.readSignal(signal, start=start, n=count)
+            self.replay(block)
+        self.edf.close()
+
+    def stream_board(self):
+        """
+        This function acquires signals from a BrainFlow board, such as the Cyton
+        board. Every read_pause seconds, every full chunk of board_chunk_size samples
+        is taken from the board and passed down the pipeline as a block of its EEG 
+        channels. A pipeline must be provided that is a list of functions to be 
+        called sequentially on the incoming signals.
+        """
+        self.acquisition.run(self.emit_block)
+
     def stream_cyton(self):
         """
-        This function reads the serial port which is specifically connected to a
-        Cyton board. The way it reads in data helps to ensure there are no skips 
-        or duplicates. A pipeline must be provided that is a list of functions 
-        to be called sequentially on the incoming signal.
+        Kept for compatibility; see Stream.stream_board.
         """
-        self.board.start_stream()
+        self.stream_board()
 
-        # Use a variable to track the last processed timestamp
-        last_timestamp = 0
+    def acquisition_stats(self) -> dict[str, float]:
+        """
+        Get the number of polls, chunks and samples acquired from the board, the mean
+        and maximum jitter of the polls in seconds, the number of overruns of the ring
+        buffer of the board, the number of samples lost, and the most samples ever
+        found waiting on the board.
+        """
+        if self.acquisition is None:
+            raise ValueError("The stream is not acquiring from a BrainFlow board.")
+        return dict(self.acquisition.stats)
 
+    def stop(self) -> None:
+        """
+        Stop acquiring from the BrainFlow board, if any, and release it.
+        """
+        if self.acquisition is not None and self.acquisition.running:
+            self.acquisition.stop()
+
+
+    def stream_general_serial(self):
+        """
+        This function reads the serial port and processes the incoming data. All
+        bytes waiting are read at once, and parsed incrementally by the SerialParser,
+        which keeps partial packets across reads, drops duplicates, and counts the
+        gaps in the serials. A pipeline must be provided that is a list of functions 
+        to be called sequentially on the incoming signals.
+        """
         while True:
-            # Get all available data from the board
-            try:
-                data = self.board.get_board_data()  # This retrieves all data since the last call
-            except BrainFlowError as e:
-                print(f"Failed to retrieve data for this iteration. Continuing onto the next iteration.")
+            data = self.serial.read(self.serial.in_waiting or 1)        # Blocks for a byte instead of spinning
+            acquired = time.monotonic()
+            block = self.parser.feed(data)
+            if block.shape[1] == 0:
                 continue
-            
-            if data.shape[1] > 0:
-                # Get timestamps and find indices of new data since last_timestamp
-                timestamps = data[BoardShim.get_timestamp_channel(self.board_id)]
-                new_data_indices = timestamps > last_timestamp
-                
-                if np.any(new_data_indices):
-                    # Update last processed timestamp
-                    last_timestamp = timestamps[new_data_indices][-1]
-                    
-                    # Get new data
-                    eeg_channels = BoardShim.get_eeg_channels(self.board_id)
-                    new_data = data[eeg_channels][:, new_data_indices]
-                
-                    # Process new data
-                    for i in range(new_data.shape[1]):
-                        signals = ",".join([str(x) for x in new_data[:, i].tolist()])   # Make a comma-separated line of values
-                        # print(signals, "\n")
-
-                        # We have obtained the clean signal. Now we process
-                        # the signal by running the pipeline provided. 
-                        for processor in self.pipeline:
-                            if type(processor) is tuple:
-                                processor[0](signals, **processor[1])
-                            else:
-                                processor(signals)
-
-                else:
-                    print("No new data.")
-            else:
-                print("No data available.")
-        
-            # Sleep a little to prevent high CPU usage, adjust as necessary
-            time.sleep(self.read_pause)
 
+            # We have obtained the clean signals. Now we process
+            # them by running the pipeline provided. 
+            self.emit_block(block, acquired=acquired)
 
-    def stream_general_serial(self):
+    def serial_stats(self) -> dict[str, int]:
         """
-        This function reads the serial port and processes the incoming data. The
-        way it reads in data helps to ensure there are no skips or duplicates. A
-        pipeline must be provided that is a list of functions to be called 
-        sequentially on the incoming signal.
+        Get the number of packets received, duplicates dropped, gaps and samples 
+        missing in the serials, and packets that could not be parsed.
         """
-        global latest_signal
-        last_series_num = 0
+        return dict(self.parser.stats)
 
-        # Reads in the data while eliminating skips and duplicates
-        while True:
-            if self.serial.in_waiting > 0:
-                packets = self.serial.readline().decode('utf-8').strip().split("||")
-                if len(packets) == 0:
-                    continue
-                for packet in packets:
-                    if packet == "":
-                        continue
-                    [series_num, signals] = packet.split("|")
-                    if int(series_num) == last_series_num:
-                        continue
-                    last_series_num = int(series_num)
-
-                    # We have obtained the clean signal. Now we process
-                    # the signal by running the pipeline provided. 
-                    for processor in self.pipeline:
-                        if type(processor) is tuple:
-                            processor[0](signals, **processor[1])
-                        else:
-                            processor(signals)
-
-
-    def onload(self, pipeline: list[callable]) -> None:
-        self.pipeline = pipeline
\ No newline at end of file
+    def collect_metrics(self) -> list[tuple]:
+        """
+        Get the ingest counters of the stream, those of the serial parser, and those
+        of the board or the replay schedule if any, as telemetry metrics.
+        """
+        metrics = [("samples_ingested_total", "counter", "Samples passed down the stream pipeline.", None, self.samples)]
+        if self.serial_port is not None and self.acquisition is None:
+            stats = self.serial_stats()
+            metrics += [
+                ("serial_packets_total", "counter", "Packets parsed from the serial port.", None, stats["packets"]),
+                ("serial_parse_errors_total", "counter", "Packets that could not be parsed.", None, stats["parse_errors"]),
+                ("serial_duplicates_total", "counter", "Duplicate packets dropped.", None, stats["duplicates"]),
+                ("serial_sequence_gaps_total", "counter", "Gaps in the packet serials.", None, stats["gaps"]),
+                ("serial_missing_samples_total", "counter", "Samples missing in the gaps.", None, stats["missing"]),
+            ]
+        if self.acquisition is not None:
+            stats = self.acquisition_stats()
+            metrics += [
+                ("board_chunks_total", "counter", "Chunks read from the board.", None, stats["chunks"]),
+                ("board_overruns_total", "counter", "Overruns of the ring buffer of the board.", None, stats["overruns"]),
+                ("board_lost_samples_total", "counter", "Samples lost by the board.", None, stats["lost_samples"]),
+                ("board_jitter_max_seconds", "gauge", "Largest jitter of the board polls.", None, stats["jitter_max"]),
+                ("board_max_buffered_samples", "gauge", "Most samples found waiting on the board.", None, stats["max_buffered"]),
+            ]
+        if self.clock is not None:
+            metrics.append(("replay_lag_seconds", "gauge", "Lag behind the replay schedule.", None, self.clock.stats()["lag"]))
+        return metrics
+
+
+    def onload(self, pipeline: list[callable], blocks: bool = False) -> None:
+        """
+        Define the pipeline called on every incoming signal. By default, each 
+        processor receives one sample at a time as a string of comma-separated
+        values. If blocks is True, each processor instead receives a (channels x n)
+        NumPy array holding every sample read in at once, such as Frame.add_block.
+        Processors of blocks with an "acquired" argument, such as Frame.add_block,
+        also receive the time.monotonic() at which the block was read. The metrics
+        of the stream are registered with the server of every Frame the pipeline
+        feeds, labelled with the name of its session.
+        """
+        self.pipeline = pipeline
+        self.blocks = blocks
+        self.timed = []
+        for processor in pipeline:
+            function = processor[0] if type(processor) is tuple else processor
+            try:
+                self.timed.append(blocks and "acquired" in inspect.signature(function).parameters)
+            except (TypeError, ValueError):
+                self.timed.append(False)
+            frame = getattr(function, "__self__", None)             # Such as frame.add_block
+            server = getattr(frame, "server", None)
+            if server is None or (id(server), frame.name) in self.telemetry_sessions:
+                continue
+            server.telemetry.add_collector(self.collect_metrics, labels={"session": frame.name})
+            self.telemetry_sessions.add((id(server), frame.name))
+
+    def _run_pipeline(self, signals, acquired: float|None = None) -> None:
+        for processor, timed in zip(self.pipeline, self.timed):
+            function, kwargs = processor if type(processor) is tuple else (processor, {})
+            if timed:
+                function(signals, acquired=acquired, **kwargs)
+            else:
+                function(signals, **kwargs)
+
+    def emit_block(self, block: np.ndarray, acquired: float|None = None) -> None:
+        """
+        Pass a (channels x n) block of samples down the pipeline, either as a whole
+        or one comma-separated sample at a time, depending on Stream.onload.
+        acquired is the time.monotonic() at which the block was read, and defaults
+        to now.
+        """
+        if acquired is None:
+            acquired = time.monotonic()
+        self.samples += block.shape[1]
+        if self.blocks:
+            self._run_pipeline(block, acquired)
+        else:
+            for signals in block.T.tolist():
+                self._run_pipeline(",".join([str(x) for x in signals]))     # Make a comma-separated line of values
\ No newline at end of file
@@ -0,0 +1,105 @@
+from functools import lru_cache
+import numpy as np
+from scipy import signal
+
+
+class StreamingFilter:
+    """
+    The StreamingFilter class applies IIR filters and moving averages to consecutive
+    windows as if they were one continuous signal. Filter designs are cached as
+    second-order sections, and the filter state of every channel is kept between
+    windows, so that each window is filtered in O(samples) without edge transients
+    at its boundaries.
+    States are kept per process and keyed by the caller; a window whose first sample
+    does not directly follow the previous window of the same key (for example, when
+    the window in between was dropped) starts from the steady state of its own first
+    sample instead. Frame runs every window of such a pipeline on the same worker.
+    """
+
+    states: dict[tuple, tuple[np.ndarray, int]] = dict()   # Key -> (zi, serial of the next expected sample)
+
+    def __init__(self) -> None:
+        raise TypeError("The StreamingFilter class is a static class, and cannot be initialized.")
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def design_pass(l_freq: float|None, h_freq: float|None, sample_rate: float, order: int = 4) -> np.ndarray:
+        """
+        Design a Butterworth high-pass, low-pass, or band-pass filter, depending on
+        which of l_freq and h_freq are given.
+        """
+        if l_freq is not None and h_freq is not None:
+            return signal.butter(order, [l_freq, h_freq], btype="bandpass", fs=sample_rate, output="sos")
+        if l_freq is not None:
+            return signal.butter(order, l_freq, btype="highpass", fs=sample_rate, output="sos")
+        if h_freq is not None:
+            return signal.butter(order, h_freq, btype="lowpass", fs=sample_rate, output="sos")
+        raise ValueError("At least one of l_freq or h_freq must be provided.")
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def design_notch(freqs: tuple[float], sample_rate: float, quality: float = 30.0) -> np.ndarray:
+        """
+        Design a cascade of IIR notch filters, one for each of the given frequencies.
+        """
+        sections = []
+        for freq in freqs:
+            b, a = signal.iirnotch(freq, quality, fs=sample_rate)
+            sections.append(signal.tf2sos(b, a))
+        return np.vstack(sections)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def design_moving_average(window: int) -> np.ndarray:
+        """
+        Design a trailing moving average of the given length as second-order sections,
+        so that it can be cascaded with other filters. Its zeros are the window-th
+        roots of unity other than 1, so they are placed exactly instead of being
+        found from the polynomial.
+        """
+        if window < 2:
+            raise ValueError("The window of a moving average must be at least 2 to be designed as a filter.")
+        zeros = np.exp(2j * np.pi * np.arange(1, window) / window)
+        return signal.zpk2sos(zeros, np.zeros(window - 1), 1.0 / window)
+
+    @staticmethod
+    def apply(sos: np.ndarray, data: np.ndarray, key: tuple, signal_serial: int) -> np.ndarray:
+        """
+        Filter a (channels x samples) window along its last axis, continuing from the
+        state left by the previous window of the same key. signal_serial is the serial
+        of the last sample of the window.
+        """
+        num_samples = data.shape[-1]
+        first_serial = signal_serial - num_samples + 1
+        state = StreamingFilter.states.get(key)
+        if state is not None and state[1] == first_serial and state[0].shape[1] == data.shape[0]:
+            zi = state[0]
+        else:
+            zi = signal.sosfilt_zi(sos)[:, np.newaxis, :] * data[np.newaxis, :, :1]
+        filtered, zf = signal.sosfilt(sos, data, axis=-1, zi=zi)
+        StreamingFilter.states[key] = (zf, signal_serial + 1)
+        return filtered
+
+    @staticmethod
+    def moving_average(data: np.ndarray, window: int, key: tuple, signal_serial: int) -> np.ndarray:
+        """
+        Apply a trailing moving average of the given length to a (channels x samples)
+        window along its last axis, using running sums. The last window - 1 samples
+        of each channel are kept, so that the average continues across windows.
+        """
+        num_samples = data.shape[-1]
+        first_serial = signal_serial - num_samples + 1
+        state = StreamingFilter.states.get(key)
+        if state is not None and state[1] == first_serial and state[0].shape == (data.shape[0], window - 1):
+            tail = state[0]
+        else:
+            tail = np.repeat(data[:, :1], window - 1, axis=-1)
+        extended = np.concatenate([tail, data], axis=-1)
+        sums = np.cumsum(extended, axis=-1)
+        sums = np.concatenate([np.zeros((data.shape[0], 1)), sums], axis=-1)
+        StreamingFilter.states[key] = (extended[:, extended.shape[-1] - (window - 1):].copy(), signal_serial + 1)
+        return (sums[:, window:] - sums[:, :num_samples]) / window
+
+    @staticmethod
+    def reset() -> None:
+        StreamingFilter.states = dict()
@@ -0,0 +1,103 @@
+import bisect, threading
+
+
+class Telemetry:
+    """
+    The Telemetry class aggregates the measurements of every part of the system,
+    such as the timing of each pipeline stage reported back by the worker processes,
+    and renders them in the Prometheus text format. Histograms and counters are
+    updated as measurements come in; gauges and the counters kept by other classes
+    (such as Stream or Frame) are read from collectors, callables returning a list
+    of (name, kind, help, labels, value) tuples, only when the metrics are scraped.
+    It is safe to use from several threads.
+    """
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    PREFIX = "eeg_"
+
+    def __init__(self, buckets: tuple[float] = BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.histograms: dict[str, dict] = dict()      # Name -> help and labels -> bucket counts, sum, count
+        self.counters: dict[str, dict] = dict()        # Name -> help and labels -> value
+        self.collectors: list[tuple[callable, dict]] = []
+
+    @staticmethod
+    def _key(labels: dict|None) -> tuple:
+        return tuple(sorted((labels or {}).items()))
+
+    def observe(self, name: str, value: float, labels: dict|None = None, help: str = "") -> None:
+        """
+        Add a measurement, such as a duration in seconds, to a histogram.
+        """
+        key = Telemetry._key(labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {"help": help, "series": dict()})
+            series = histogram["series"].get(key)
+            if series is None:
+                series = histogram["series"][key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def increment(self, name: str, amount: float = 1, labels: dict|None = None, help: str = "") -> None:
+        key = Telemetry._key(labels)
+        with self.lock:
+            counter = self.counters.setdefault(name, {"help": help, "series": dict()})
+            counter["series"][key] = counter["series"].get(key, 0) + amount
+
+    def add_collector(self, collector: callable, labels: dict|None = None) -> None:
+        """
+        Add a callable returning (name, kind, help, labels, value) tuples, where kind
+        is "counter" or "gauge", read whenever the metrics are rendered. The given
+        labels are added to those of every value it returns.
+        """
+        with self.lock:
+            self.collectors.append((collector, dict(labels or {})))
+
+    @staticmethod
+    def _format_labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        escaped = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        families: dict[str, dict] = dict()              # Name -> kind, help and (labels, value) lines
+        with self.lock:
+            collectors = list(self.collectors)
+            for name, counter in self.counters.items():
+                family = families.setdefault(name, {"kind": "counter", "help": counter["help"], "samples": []})
+                family["samples"].extend((name, key, value) for key, value in counter["series"].items())
+            for name, histogram in self.histograms.items():
+                family = families.setdefault(name, {"kind": "histogram", "help": histogram["help"], "samples": []})
+                for key, series in histogram["series"].items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, series["buckets"]):
+                        cumulative += count
+                        family["samples"].append((f"{name}_bucket", key + (("le", repr(bound)),), cumulative))
+                    family["samples"].append((f"{name}_bucket", key + (("le", "+Inf"),), series["count"]))
+                    family["samples"].append((f"{name}_sum", key, series["sum"]))
+                    family["samples"].append((f"{name}_count", key, series["count"]))
+
+        for collector, extra_labels in collectors:
+            for name, kind, help, labels, value in collector():
+                family = families.setdefault(name, {"kind": kind, "help": help, "samples": []})
+                family["samples"].append((name, Telemetry._key(dict(extra_labels, **(labels or {}))), value))
+
+        lines = []
+        for name, family in families.items():
+            full_name = Telemetry.PREFIX + name
+            lines.append(f"# HELP {full_name} {family['help']}")
+            lines.append(f"# TYPE {full_name} {family['kind']}")
+            for sample_name, labels, value in family["samples"]:
+                lines.append(f"{Telemetry.PREFIX}{sample_name}{Telemetry._format_labels(labels)} {float(value)!r}")
+        return "\n".join(lines) + "\n"
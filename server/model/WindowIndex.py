@@ -0,0 +1,117 @@
+import numpy as np
+import json, sqlite3, threading
+
+
+class WindowIndex:
+    """
+    The WindowIndex class indexes the windows of a session in an SQLite database,
+    one row per window: its serial (that of its last sample), its begin time, the
+    names of its artifacts, and the minimum, maximum, mean and standard deviation of
+    each channel. Windows can then be paged through by time without walking the
+    output folders, and long time ranges can be summarized from the statistics
+    alone. It is safe to use from several threads.
+    """
+
+    STATS = ("minimum", "maximum", "mean", "std")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS windows (
+                    serial INTEGER PRIMARY KEY,
+                    begin_time REAL,
+                    artifacts TEXT NOT NULL DEFAULT '[]',
+                    minimum BLOB,
+                    maximum BLOB,
+                    mean BLOB,
+                    std BLOB
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS windows_begin_time ON windows (begin_time)")
+
+    def add_window(self, serial: int, begin_time: float|None, data: np.ndarray) -> None:
+        """
+        Index a (channels x samples) window with the statistics of its channels.
+        """
+        stats = [
+            data.min(axis=-1), 
+            data.max(axis=-1), 
+            data.mean(axis=-1, dtype=np.float64), 
+            data.std(axis=-1, dtype=np.float64)]
+        blobs = [np.ascontiguousarray(stat, dtype="<f4").tobytes() for stat in stats]
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO windows (serial, begin_time, minimum, maximum, mean, std) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (serial) DO UPDATE SET 
+                    begin_time = excluded.begin_time, minimum = excluded.minimum, 
+                    maximum = excluded.maximum, mean = excluded.mean, std = excluded.std""",
+                (serial, begin_time, *blobs))
+
+    def set_artifacts(self, serial: int, artifacts: list[str]) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO windows (serial, artifacts) VALUES (?, ?)
+                ON CONFLICT (serial) DO UPDATE SET artifacts = excluded.artifacts""",
+                (serial, json.dumps(artifacts)))
+
+    def _select(self, columns: str, start: float|None, end: float|None, after: int|None, limit: int|None) -> list[tuple]:
+        conditions, parameters = [], []
+        if start is not None:
+            conditions.append("begin_time >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("begin_time < ?")
+            parameters.append(end)
+        if after is not None:
+            conditions.append("serial > ?")
+            parameters.append(after)
+        query = f"SELECT {columns} FROM windows"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY serial"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    def query(self, start: float|None = None, end: float|None = None, after: int|None = None, limit: int = 100) -> list[dict]:
+        """
+        Get the windows beginning in [start, end), in seconds since the epoch, with
+        a serial greater than after, at most limit of them, in order.
+        """
+        rows = self._select(
+            "serial, begin_time, artifacts, minimum, maximum, mean, std", start, end, after, limit)
+        windows = []
+        for serial, begin_time, artifacts, *stats in rows:
+            windows.append({
+                "serial": serial,
+                "window": str(serial),
+                "begin_time": begin_time,
+                "artifacts": json.loads(artifacts),
+                "stats": {name: (np.frombuffer(stat, dtype="<f4").tolist() if stat is not None else None)
+                          for name, stat in zip(WindowIndex.STATS, stats)},
+            })
+        return windows
+
+    def summaries(self, start: float|None = None, end: float|None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the serials of the windows beginning in [start, end), and the (windows x
+        channels) minimum and maximum of their channels.
+        """
+        rows = self._select("serial, minimum, maximum", start, end, None, None)
+        rows = [row for row in rows if row[1] is not None]
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype="<f4"), np.zeros((0, 0), dtype="<f4")
+        serials = np.array([row[0] for row in rows], dtype=np.int64)
+        minimum = np.frombuffer(b"".join(row[1] for row in rows), dtype="<f4").reshape(len(rows), -1)
+        maximum = np.frombuffer(b"".join(row[2] for row in rows), dtype="<f4").reshape(len(rows), -1)
+        return serials, minimum, maximum
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
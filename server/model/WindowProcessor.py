@@ -0,0 +1,85 @@
+import time
+from model.MNEDriver import MNEDriver
+from model.PipelinePlan import PipelinePlan
+from model.SharedWindowBuffer import SharedWindowBuffer
+
+
+class WindowProcessor:
+    """
+    The WindowProcessor class runs the pipeline compiled by Frame.wrap on a single
+    window of signals. It holds only what the pipeline needs, so that it can be sent
+    to the worker processes once, instead of sending the whole Frame for every window.
+    The windows themselves are read from shared memory, given the index of their slot,
+    into one MNEDriver per worker process, which is built with the first window and
+    then only loaded with the next ones.
+    """
+
+    def __init__(
+            self,
+            sample_rate: int,
+            channels: list[str],
+            output_destination: str,
+            plan: PipelinePlan,
+            windows: SharedWindowBuffer,
+            montage: str = "standard_1020",
+            channel_types: list[str]|None = None,
+            ) -> None:
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.output_destination = output_destination
+        self.plan = plan
+        self.windows = windows
+        self.montage = montage
+        self.channel_types = channel_types
+        self.mne_driver = None                              # Built in the worker, with its first window
+
+    def __call__(
+            self, 
+            slot: int, 
+            window_begin_time:str|None = None, 
+            signal_serial:int = 0, 
+            window_begin_timestamp:float|None = None,
+            ) -> dict:
+        """
+        Run the pipeline on the window in the given slot, and return the window, i.e.
+        the name of its folder, the names of the artifacts written into it, once they
+        are all complete, and when the pipeline started, when each stage started and
+        ended, and when the artifacts were written, as time.monotonic() timestamps,
+        with the CPU time of every stage in seconds.
+        """
+        started, begin_cpu = time.monotonic(), time.process_time()
+        try:
+            if self.mne_driver is None:
+                self.mne_driver = MNEDriver(
+                    sample_rate=self.sample_rate,
+                    channels=self.channels,
+                    channel_types=self.channel_types,
+                    channel_data_lists=self.windows.view(slot),
+                    output_destination=self.output_destination,
+                    signal_serial=signal_serial,
+                    montage=self.montage,
+                    window_begin_time=window_begin_time,
+                    window_begin_timestamp=window_begin_timestamp,
+                )
+            else:
+                self.mne_driver.load_window(
+                    self.windows.view(slot), signal_serial, window_begin_time, window_begin_timestamp)
+        finally:
+            self.windows.release(slot)                      # MNEDriver holds its own copy of the window
+        mne_driver = self.mne_driver
+
+        stages = [("setup", started, time.monotonic(), time.process_time() - begin_cpu)]
+
+        for step in self.plan:
+            stage_start, stage_cpu = time.monotonic(), time.process_time()
+            step(mne_driver)
+            stages.append((step.name, stage_start, time.monotonic(), time.process_time() - stage_cpu))
+
+        return {
+            "window": str(signal_serial), 
+            "artifacts": list(mne_driver.artifacts),
+            "started": started,
+            "stages": stages,
+            "written": time.monotonic(),
+        }
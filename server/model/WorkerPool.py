@@ -0,0 +1,239 @@
+from collections import deque
+import multiprocessing, threading, traceback
+
+
+def _work(index, job_queue, result_queue, handlers) -> None:
+    """
+    The loop run by every worker process. Jobs are (name, args) pairs, where the
+    name selects the registered handler; None stops the worker. Results are sent
+    back with the index of the worker, so that the pool knows it is free again.
+    """
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        name, args = job
+        try:
+            result = handlers[name](*args)
+        except Exception:
+            traceback.print_exc()
+            result = None
+        result_queue.put((name, index, result))
+
+
+class WorkerPool:
+    """
+    The WorkerPool class keeps a fixed number of long-lived worker processes that
+    run window pipelines, so that no process is spawned per window. Handlers are
+    registered by name before the pool starts, and each of them gets its own
+    bounded queue of jobs. When a queue is full, the overflow policy decides what
+    happens to a new job:
+
+    - "block": Wait until the queue has room again.
+    - "drop_oldest": Discard the oldest queued job to make room for the new one.
+    - "drop_newest": Discard the new job.
+
+    A dispatcher thread hands queued jobs to the workers in turn across handlers,
+    one job per worker at a time, so that queued jobs stay under the control of the
+    overflow policy. Every worker has a queue of its own. A handler registered with
+    affinity, such as a pipeline that carries filter state from one window to the
+    next, is pinned to a single worker, which then runs all of its jobs in order;
+    the jobs of other handlers go to whichever worker is free.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+    def __init__(
+            self,
+            num_workers: int = 2,
+            max_queued: int = 4,
+            overflow_policy: str = "drop_oldest",
+            ) -> None:
+
+        if overflow_policy not in WorkerPool.OVERFLOW_POLICIES:
+            raise ValueError(f"The overflow policy must be one of {WorkerPool.OVERFLOW_POLICIES}.")
+        if num_workers < 1 or max_queued < 1:
+            raise ValueError("The number of workers and the queue size must be positive.")
+
+        self.num_workers = num_workers
+        self.max_queued = max_queued
+        self.overflow_policy = overflow_policy
+        self.handlers = dict()                              # Name -> picklable handler callable
+        self.on_drop = dict()                               # Name -> callable receiving the args of a dropped job
+        self.on_complete = dict()                           # Name -> callable receiving the result of a job
+        self.queues: dict[str, deque] = dict()              # Name -> queued job args
+        self.affinity: dict[str, int|None] = dict()         # Name -> index of its worker, if pinned
+        self.counters: dict[str, dict[str, int]] = dict()   # Name -> submitted, dropped, dispatched, completed
+        self.condition = threading.Condition()
+        self.workers = []
+        self.started = False
+        self.stopping = False
+
+    def register(
+            self, 
+            name: str, 
+            handler: callable, 
+            on_drop=None, 
+            on_complete=None, 
+            affinity: bool = False,
+            ) -> None:
+        """
+        Register a handler, which the workers call as handler(*args) for every job
+        submitted under the given name. Handlers are sent to the workers only once,
+        when the pool starts. on_complete is called in the parent process with the
+        result of every job that returned something other than None. If affinity is
+        True, every job of the handler runs on the same worker, one after the other,
+        so that state the handler keeps in the worker process carries over from one
+        job to the next; pinned handlers are spread evenly across the workers.
+        """
+        if self.started:
+            raise RuntimeError("Handlers must be registered before the pool starts.")
+        if affinity:
+            pinned = [index for index in self.affinity.values() if index is not None]
+            self.affinity[name] = min(range(self.num_workers), key=pinned.count)
+        else:
+            self.affinity[name] = None
+        self.handlers[name] = handler
+        self.on_drop[name] = on_drop
+        self.on_complete[name] = on_complete
+        self.queues[name] = deque()
+        self.counters[name] = {"submitted": 0, "dropped": 0, "dispatched": 0, "completed": 0}
+
+    def start(self) -> None:
+        """
+        Start the worker processes and the threads that feed and drain them.
+        """
+        if self.started:
+            return
+        self.job_queues = [multiprocessing.Queue() for _ in range(self.num_workers)]
+        self.busy = [False] * self.num_workers              # Whether each worker holds a job
+        self.result_queue = multiprocessing.Queue()
+        for index in range(self.num_workers):
+            worker = multiprocessing.Process(
+                target=_work,
+                args=(index, self.job_queues[index], self.result_queue, self.handlers))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+        self.started = True
+
+    def submit(self, name: str, *args) -> bool:
+        """
+        Queue a job for the handler of the given name. Returns False if the job was
+        dropped under the "drop_newest" policy, and True otherwise.
+        """
+        dropped = None
+        with self.condition:
+            queue = self.queues[name]
+            counters = self.counters[name]
+            counters["submitted"] += 1
+            if len(queue) >= self.max_queued:
+                if self.overflow_policy == "drop_newest":
+                    counters["dropped"] += 1
+                    dropped = args
+                elif self.overflow_policy == "drop_oldest":
+                    counters["dropped"] += 1
+                    dropped = queue.popleft()
+                else:
+                    while len(queue) >= self.max_queued and not self.stopping:
+                        self.condition.wait()
+            if dropped is not args:
+                queue.append(args)
+                self.condition.notify_all()
+
+        if dropped is not None and self.on_drop[name] is not None:
+            self.on_drop[name](*dropped)
+        return dropped is not args
+
+    def stats(self, name: str) -> dict[str, int]:
+        """
+        Get the counters of the handler of the given name. "queued" is the number
+        of jobs waiting for a worker, and "in_flight" the number handed to workers
+        that have not completed yet.
+        """
+        with self.condition:
+            counters = dict(self.counters[name])
+            counters["queued"] = len(self.queues[name])
+        counters["in_flight"] = counters["dispatched"] - counters["completed"]
+        return counters
+
+    def _next_job(self):
+        # Take turns across handlers, so that a busy handler cannot starve the others
+        for _ in range(len(self.queues)):
+            name = next(self.turns)
+            if not self.queues[name]:
+                continue
+            worker = self.affinity[name]
+            if worker is None:
+                worker = next((index for index, busy in enumerate(self.busy) if not busy), None)
+            if worker is not None and not self.busy[worker]:
+                return name, self.queues[name].popleft(), worker
+        return None
+
+    def _dispatch(self) -> None:
+        self.turns = self._cycle_names()
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None and not self.stopping:
+                    self.condition.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+                name, args, worker = job
+                self.counters[name]["dispatched"] += 1
+                self.busy[worker] = True
+                self.condition.notify_all()
+            self.job_queues[worker].put((name, args))
+
+    def _cycle_names(self):
+        while True:
+            for name in list(self.queues):
+                yield name
+
+    def _collect(self) -> None:
+        while True:
+            message = self.result_queue.get()
+            if message is None:
+                return
+            name, worker, result = message
+            with self.condition:
+                self.counters[name]["completed"] += 1
+                self.busy[worker] = False
+                self.condition.notify_all()                 # The worker can take the next job
+            if result is not None and self.on_complete[name] is not None:
+                try:
+                    self.on_complete[name](result)
+                except Exception:
+                    traceback.print_exc()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the pool once the jobs handed to the workers are done, and join every
+        worker process. Jobs still waiting in the queues are discarded, and workers
+        that do not finish within the timeout are terminated.
+        """
+        if not self.started:
+            return
+        with self.condition:
+            self.stopping = True
+            for queue in self.queues.values():
+                queue.clear()
+            self.condition.notify_all()
+        self.dispatcher.join(timeout)
+        for worker, job_queue in zip(self.workers, self.job_queues):
+            if worker.is_alive():
+                job_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.result_queue.put(None)
+        self.collector.join(timeout)
+        self.workers = []
+        self.started = False
@@ -0,0 +1,34 @@
+from model.SessionManager import SessionManager
+from model.Stream import Stream
+from model.MNEDriver import MNEDriver
+from model.Server import Server
+
+
+if __name__ == '__main__':
+
+    # One server and one pool of workers are shared by every session
+    server = Server(host="0.0.0.0", port=8000)
+    manager = SessionManager(
+        output_directory="./server/results",
+        server=server,
+        num_workers=4,)
+
+    # Each headset is a session of its own, served under /sessions/<name>
+    for name in ["headset-1", "headset-2"]:
+        stream = Stream(
+            board_type='Synthetic', 
+            board_name=name,                                    # Tells the synthetic boards apart
+            read_pause=0.02,)
+        manager.add_session(
+            name=name,
+            stream=stream,
+            pipeline=[
+                (MNEDriver.stream_filter, {"l_freq": 1, "h_freq": 45}),
+                MNEDriver.render_psd,                           # Waveforms are drawn by the portal
+            ],
+            channels=stream.channel_labels,
+            sample_rate=stream.sample_rate,
+            max_cache_samples=stream.sample_rate * 2,
+            window_size_samples=stream.sample_rate,)
+
+    manager.run()
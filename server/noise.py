@@ -64,7 +64,7 @@ if __name__ == '__main__':
         drop_last=2,
         drop_first=1,
     )
-    stream.onload(pipeline=[frame.add_singal,])
+    stream.onload(pipeline=[frame.add_block,], blocks=True)
     stream.start()
 
     # Running the FastAPI server
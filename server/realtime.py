@@ -18,7 +18,7 @@ if __name__ == '__main__':
         # MNEDriver.record_data,
         MNEDriver.plot_data,
         MNEDriver.plot_psd,
-        (MNEDriver.filter, {"l_freq": 15, "h_freq": 45}),
+        (MNEDriver.stream_filter, {"l_freq": 15, "h_freq": 45}),
         MNEDriver.plot_data,
         MNEDriver.plot_psd,
     ])
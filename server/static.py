@@ -34,7 +34,8 @@ if __name__ == '__main__':
         drop_first=1,
     )
     stream.onload(pipeline=[
-        frame.add_singal,])
+        frame.add_block,], 
+        blocks=True)
     stream.start()
 
     # Running the FastAPI server
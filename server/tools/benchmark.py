@@ -0,0 +1,228 @@
+import argparse, itertools, json, os, platform, resource, shutil, subprocess, sys, tempfile, time
+from datetime import datetime
+import numpy as np
+import mne
+import pyedflib
+from pyedflib import highlevel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model.Frame import Frame
+from model.MNEDriver import MNEDriver
+from model.Server import Server
+from model.Stream import Stream
+
+
+PIPELINES = {
+    "none": [],
+    "filter": [
+        (MNEDriver.stream_filter, {"l_freq": 1, "h_freq": 40}),
+        (MNEDriver.stream_notch_filter, {"freqs": [50]}),
+    ],
+    "psd": [
+        MNEDriver.record_psd,
+    ],
+    "render": [
+        MNEDriver.render_data,
+        MNEDriver.render_psd,
+    ],
+    "plot": [
+        MNEDriver.plot_data,
+        MNEDriver.plot_psd,
+    ],
+    "record": [
+        MNEDriver.record_session,
+    ],
+    "full": [
+        (MNEDriver.stream_filter, {"l_freq": 1, "h_freq": 40}),
+        (MNEDriver.stream_notch_filter, {"freqs": [50]}),
+        MNEDriver.record_session,
+        MNEDriver.render_data,
+        MNEDriver.render_psd,
+        MNEDriver.record_psd,
+    ],
+}
+
+
+def write_synthetic_edf(path, channels, sample_rate, duration):
+    """
+    Write an EDF file of random-walk signals with a 10 Hz rhythm, in microvolts.
+    """
+    num_samples = int(sample_rate * duration)
+    times = np.arange(num_samples) / sample_rate
+    generator = np.random.default_rng(0)
+    signals = np.cumsum(generator.normal(0, 1, (len(channels), num_samples)), axis=1)
+    signals -= signals.mean(axis=1, keepdims=True)
+    signals += 20 * np.sin(2 * np.pi * 10 * times)
+    signals = np.clip(signals, -3000, 3000)
+    headers = highlevel.make_signal_headers(
+        channels, dimension="uV", sample_frequency=sample_rate, physical_min=-3000, physical_max=3000)
+    highlevel.write_edf(path, signals, headers)
+
+
+def run_single(config):
+    """
+    Run one configuration end to end, Stream -> Frame -> pipeline -> Server, and
+    return its measurements. Meant to run in a process of its own, so that the
+    resource usage of one configuration does not leak into the next.
+    """
+    directory = tempfile.mkdtemp(prefix="eeg-benchmark-")
+    if config["edf"] is None:
+        channels = mne.channels.make_standard_montage("standard_1020").ch_names[:config["channels"]]
+        edf_path = os.path.join(directory, "synthetic.edf")
+        write_synthetic_edf(edf_path, channels, config["sample_rate"], config["duration"])
+        drop_last = 0
+    else:
+        edf_path = config["edf"]
+        with pyedflib.EdfReader(edf_path) as reader:
+            drop_last = max(0, reader.signals_in_file - config["channels"])
+        channels = mne.channels.make_standard_montage("standard_1020").ch_names[:config["channels"]]
+
+    speed = config["speed"]
+    stream = Stream(file_name=edf_path, drop_last=drop_last, read_pause=0 if speed is None else 1.0, speed=speed)
+    channels = channels[:len(stream.edf_signals)]
+    sample_rate = stream.sample_rate
+    window_size = int(round(config["window_seconds"] * sample_rate))
+
+    server = Server(host="localhost", port=0, record_history=config["record_history"])
+    frame = Frame(
+        channels=channels,
+        sample_rate=sample_rate,
+        max_cache_samples=2 * window_size,
+        window_size_samples=window_size,
+        output_directory=os.path.join(directory, "results"),
+        server=server,
+        num_workers=config["workers"],
+        overflow_policy=config["overflow_policy"],
+        latency_history=1 << 20)
+    frame.wrap(pipeline=PIPELINES[config["pipeline"]])
+    stream.onload(pipeline=[frame.add_block], blocks=True)
+
+    # Ingest the whole file, then wait for the workers to finish every window
+    begin = time.perf_counter()
+    stream.start()
+    ingest_time = time.perf_counter() - begin
+    deadline = time.perf_counter() + config["timeout"]
+    while time.perf_counter() < deadline:
+        stats = frame.get_stats()
+        if stats["completed"] + stats["dropped"] >= stats["submitted"]:
+            break
+        time.sleep(0.01)
+    server.close()                                              # Waits for the windows still being recorded
+    total_time = time.perf_counter() - begin
+    stats = frame.get_stats()
+    latency = frame.get_latency()
+
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    frame.close()                                               # Joins the workers, so their usage is counted
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    parent = resource.getrusage(resource.RUSAGE_SELF)
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+    num_samples = stream.replay_stats()["emitted"]
+    worker_cpu = (children_after.ru_utime + children_after.ru_stime
+                  - children_before.ru_utime - children_before.ru_stime)
+
+    return dict(config, **{
+        "channels": len(channels),
+        "sample_rate": sample_rate,
+        "window_size_samples": window_size,
+        "samples": num_samples,
+        "ingest_time_s": ingest_time,
+        "total_time_s": total_time,
+        "ingest_samples_per_s": num_samples / ingest_time if ingest_time > 0 else None,
+        "throughput_samples_per_s": num_samples / total_time if total_time > 0 else None,
+        "throughput_values_per_s": num_samples * len(channels) / total_time if total_time > 0 else None,
+        "realtime_factor": num_samples / total_time / sample_rate if total_time > 0 else None,
+        "windows": stats,
+        "latency_ms": {                                         # From the last sample of a window to its publication, without clients
+            key: latency["total"][key] * 1e3 if "total" in latency else None
+            for key in ("p50", "p90", "p99", "max")},
+        "latency_breakdown_ms": {
+            segment: {key: value * 1e3 for key, value in summary.items() if key != "count"}
+            for segment, summary in latency.items()},
+        "worker_cpu_s": worker_cpu,
+        "worker_cpu_utilization": worker_cpu / total_time / config["workers"] if total_time > 0 else None,
+        "parent_cpu_s": parent.ru_utime + parent.ru_stime,
+        "peak_rss_mb": {
+            "parent": parent.ru_maxrss / 1024,                  # ru_maxrss is in kilobytes on Linux
+            "worker": children_after.ru_maxrss / 1024,
+        },
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Stream -> Frame -> pipeline -> Server path.")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 8, 16, 64], help="Channel counts to sweep.")
+    parser.add_argument("--rates", type=float, nargs="+", default=[250, 500], help="Sample rates to sweep, for synthetic data.")
+    parser.add_argument("--window-seconds", type=float, nargs="+", default=[1.0], help="Window lengths to sweep, in seconds.")
+    parser.add_argument("--pipelines", nargs="+", default=["none", "filter", "render", "full"], choices=sorted(PIPELINES), help="Pipelines to sweep.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of synthetic signal replayed per run.")
+    parser.add_argument("--edf", type=str, default=None, help="Replay this EDF file instead of synthetic data; its sample rate replaces --rates.")
+    parser.add_argument("--speed", type=float, default=None, help="Replay speed relative to real time; as fast as possible if not given.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes.")
+    parser.add_argument("--overflow-policy", default="block", choices=["block", "drop_oldest", "drop_newest"], help="Overflow policy of the Frame; block measures the sustained throughput.")
+    parser.add_argument("--no-history", action="store_true", help="Do not record and index windows in the Server.")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for the workers after ingestion.")
+    parser.add_argument("--output", type=str, default=None, help="Path of the JSON report; printed if not given.")
+    parser.add_argument("--single", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_single(json.loads(args.single))))
+        return
+
+    rates = [None] if args.edf is not None else args.rates
+    results = []
+    for channels, sample_rate, window_seconds, pipeline in itertools.product(
+            args.channels, rates, args.window_seconds, args.pipelines):
+        config = {
+            "channels": channels,
+            "sample_rate": sample_rate,
+            "window_seconds": window_seconds,
+            "pipeline": pipeline,
+            "duration": args.duration,
+            "edf": args.edf,
+            "speed": args.speed,
+            "workers": args.workers,
+            "overflow_policy": args.overflow_policy,
+            "record_history": not args.no_history,
+            "timeout": args.timeout,
+        }
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--single", json.dumps(config)],
+            capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            results.append(dict(config, error=completed.stderr.strip().splitlines()[-1:]))
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{pipeline:>8} | {result['channels']:>3} ch | {result['sample_rate']:>6g} Hz | "
+              f"{window_seconds:>5g} s | {result['throughput_samples_per_s']:>10.0f} samples/s | "
+              f"p50 {result['latency_ms']['p50'] or 0:>8.1f} ms | p99 {result['latency_ms']['p99'] or 0:>8.1f} ms | "
+              f"workers {100 * result['worker_cpu_utilization']:>5.1f}% CPU | "
+              f"RSS {result['peak_rss_mb']['parent']:>6.0f}/{result['peak_rss_mb']['worker']:>6.0f} MB",
+              file=sys.stderr)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "mne": mne.__version__,
+        },
+        "results": results,
+    }
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
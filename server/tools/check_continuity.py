@@ -0,0 +1,141 @@
+import argparse, os, shutil, sys, tempfile, time
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model.Frame import Frame
+from model.MNEDriver import MNEDriver
+from model.SessionStore import SessionStore
+from model.StreamingFilter import StreamingFilter
+
+
+def read_recorded(frame, num_windows):
+    """
+    Read back the (channels x samples) signals recorded by the record_session stage
+    of every window.
+    """
+    store = SessionStore(os.path.join(frame.output_destination, "session"))
+    windows = [store.read_window(window) for window in range(num_windows)]
+    if any(window is None for window in windows):
+        raise RuntimeError("Some windows were not recorded.")
+    return np.concatenate([np.asarray(window, dtype=np.float64) for window in windows], axis=1)
+
+
+def continuous_sosfilt(sos, signals):
+    # One pass over the whole signal, starting from the steady state of its first sample
+    zi = signal.sosfilt_zi(sos)[:, np.newaxis, :] * signals[np.newaxis, :, :1]
+    return signal.sosfilt(sos, signals, axis=-1, zi=zi)[0]
+
+
+def check_filter(frame, signals, num_windows):
+    sos = StreamingFilter.design_pass(15, 45, frame.sample_rate, 4)
+    return np.abs(read_recorded(frame, num_windows) - continuous_sosfilt(sos, signals)).max()
+
+
+def check_moving_average(frame, signals, num_windows):
+    # A window too long to be fused, so that the running sums of stream_moving_average are used
+    window = 20
+    padded = np.concatenate([np.repeat(signals[:, :1], window - 1, axis=1), signals], axis=1)
+    kernel = np.ones(window) / window
+    expected = np.array([np.convolve(channel, kernel, mode="valid") for channel in padded])
+    return np.abs(read_recorded(frame, num_windows) - expected).max()
+
+
+def check_cascade(frame, signals, num_windows):
+    sos = np.vstack([
+        StreamingFilter.design_pass(1, 40, frame.sample_rate, 4),
+        StreamingFilter.design_notch((50.0,), frame.sample_rate, 30.0),
+        StreamingFilter.design_moving_average(3)])
+    return np.abs(read_recorded(frame, num_windows) - continuous_sosfilt(sos, signals)).max()
+
+
+def check_psd(frame, signals, num_windows):
+    # The running average of the last window covers every segment of the signal so far
+    nperseg = int(frame.sample_rate)
+    serial = num_windows * frame.window_size_samples - 1
+    with np.load(os.path.join(frame.output_destination, str(serial), "0-psd.npz")) as recorded:
+        average = recorded["average"].astype(np.float64)
+    _, expected = signal.welch(signals, fs=frame.sample_rate, nperseg=nperseg, noverlap=nperseg // 2, axis=-1)
+    if average.shape != expected.shape:
+        return np.inf                                   # A worker without the earlier segments recorded no average
+    return np.abs(average - expected).max() / np.abs(expected).max()
+
+
+CHECKS = {
+    "filter": {
+        "pipeline": [(MNEDriver.stream_filter, {"l_freq": 15, "h_freq": 45}), MNEDriver.record_session],
+        "compare": check_filter,
+    },
+    "moving_average": {
+        "pipeline": [(MNEDriver.stream_moving_average, {"window": 20}), MNEDriver.record_session],
+        "compare": check_moving_average,
+    },
+    "cascade": {
+        "pipeline": [
+            (MNEDriver.stream_filter, {"l_freq": 1, "h_freq": 40}),
+            (MNEDriver.stream_notch_filter, {"freqs": [50]}),
+            (MNEDriver.stream_moving_average, {"window": 3}),
+            MNEDriver.record_session],
+        "compare": check_cascade,
+    },
+    "psd": {
+        "pipeline": [MNEDriver.record_psd],
+        "compare": check_psd,
+    },
+}
+
+
+def run_check(name, num_workers, sample_rate, window_size, num_windows, block_size):
+    """
+    Replay random signals through a Frame in blocks, with the given number of
+    workers and no window dropped, and return the largest difference between what
+    the pipeline produced and the same processing run once over the whole signal.
+    """
+    directory = tempfile.mkdtemp(prefix="eeg-continuity-")
+    channels = ["Fp1", "Fp2", "F3", "F4"]
+    signals = np.random.default_rng(0).normal(size=(len(channels), num_windows * window_size))
+    frame = Frame(
+        channels=channels,
+        sample_rate=sample_rate,
+        max_cache_samples=2 * window_size,
+        window_size_samples=window_size,
+        output_directory=directory,
+        num_workers=num_workers,
+        overflow_policy="block")
+    try:
+        frame.wrap(pipeline=CHECKS[name]["pipeline"])
+        for start in range(0, signals.shape[1], block_size):
+            frame.add_block(signals[:, start:start + block_size])
+        while frame.get_stats()["completed"] < num_windows:
+            time.sleep(0.01)
+        return CHECKS[name]["compare"](frame, signals, num_windows)
+    finally:
+        frame.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that stages carrying state across windows give the same result with several workers "
+                    "as one run over the whole signal.")
+    parser.add_argument("--checks", nargs="+", default=sorted(CHECKS), choices=sorted(CHECKS), help="Checks to run.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Numbers of worker processes.")
+    parser.add_argument("--rate", type=float, default=125, help="Sample rate.")
+    parser.add_argument("--window", type=int, default=60, help="Window size, in samples.")
+    parser.add_argument("--windows", type=int, default=10, help="Number of windows replayed.")
+    parser.add_argument("--block", type=int, default=7, help="Number of samples added to the frame at once.")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Largest difference allowed.")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.checks:
+        for num_workers in args.workers:
+            error = run_check(name, num_workers, args.rate, args.window, args.windows, args.block)
+            passed = error <= args.tolerance
+            failed |= not passed
+            print(f"{name:>16} | {num_workers} workers | max difference {error:.3g} | {'ok' if passed else 'FAILED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()